@@ -5,9 +5,31 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BASE_DIR = Path(__file__).parent.parent
-STORAGE_DIR = BASE_DIR / "storage"
-DB_PATH = BASE_DIR / "studio.db"
+STORAGE_DIR = Path(os.getenv("STORAGE_DIR", BASE_DIR / "storage"))
+DB_PATH = Path(os.getenv("DB_PATH", BASE_DIR / "studio.db"))
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY") or None
 
-STORAGE_DIR.mkdir(exist_ok=True)
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "10"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", str(16 * 1024)))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+ASSET_CACHE_MAX_BYTES = int(os.getenv("ASSET_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LAYER_CACHE_MAX_BYTES = int(os.getenv("LAYER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", "16"))
+RENDER_JOBS_PER_PROJECT = int(os.getenv("RENDER_JOBS_PER_PROJECT", "4"))
+
+COLOUR_WORKERS = int(os.getenv("COLOUR_WORKERS", str(min(4, os.cpu_count() or 1))))
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", "4"))
+VISION_TIMEOUT = float(os.getenv("VISION_TIMEOUT", "90"))
+VISION_MAX_RETRIES = int(os.getenv("VISION_MAX_RETRIES", "3"))
+ANALYSIS_JOB_CONCURRENCY = int(os.getenv("ANALYSIS_JOB_CONCURRENCY", "2"))
+
+ANALYSIS_CACHE_TTL_DAYS = int(os.getenv("ANALYSIS_CACHE_TTL_DAYS", "30"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+STORAGE_DIR.mkdir(parents=True, exist_ok=True)
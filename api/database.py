@@ -1,5 +1,11 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
 import aiosqlite
-from api.config import DB_PATH
+from fastapi import Request
+from api.config import (
+    DB_PATH, DB_READERS, DB_ACQUIRE_TIMEOUT, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_BUSY_TIMEOUT_MS,
+)
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS style_profiles (
@@ -61,27 +67,215 @@ CREATE TABLE IF NOT EXISTS assets (
     metadata TEXT NOT NULL DEFAULT '{}',
     uploaded_at TEXT NOT NULL DEFAULT (datetime('now'))
 );
+
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL CHECK (kind IN ('colours', 'vision')),
+    value TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    last_used_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache(last_used_at);
+
+CREATE TABLE IF NOT EXISTS profile_images (
+    profile_id TEXT NOT NULL,
+    image_path TEXT NOT NULL,
+    colours TEXT NOT NULL DEFAULT '{}',
+    vision TEXT NOT NULL DEFAULT '{}',
+    added_at TEXT NOT NULL DEFAULT (datetime('now')),
+    PRIMARY KEY (profile_id, image_path),
+    FOREIGN KEY (profile_id) REFERENCES style_profiles(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id TEXT PRIMARY KEY,
+    profile_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'completed', 'failed')),
+    total INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY (profile_id) REFERENCES style_profiles(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status ON analysis_jobs(status);
+
+CREATE TABLE IF NOT EXISTS analysis_job_items (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    image_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'done')),
+    colours TEXT,
+    vision TEXT,
+    PRIMARY KEY (job_id, position),
+    FOREIGN KEY (job_id) REFERENCES analysis_jobs(id) ON DELETE CASCADE
+);
 """
 
 
+# Column changes to tables created by SCHEMA, applied in order and tracked with
+# PRAGMA user_version. Append only; never edit an entry that has shipped.
+MIGRATIONS = [
+    "ALTER TABLE style_profiles ADD COLUMN stats TEXT NOT NULL DEFAULT '{}'",
+    "CREATE INDEX IF NOT EXISTS idx_zones_project ON zones(project_id, zone_order)",
+    "CREATE INDEX IF NOT EXISTS idx_projects_created ON projects(created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_style_profiles_updated ON style_profiles(updated_at, id)",
+    "ALTER TABLE assets ADD COLUMN blob_sha256 TEXT REFERENCES blobs(sha256)",
+    "CREATE INDEX IF NOT EXISTS idx_assets_blob ON assets(blob_sha256)",
+    "ALTER TABLE assets ADD COLUMN width INTEGER",
+    "ALTER TABLE assets ADD COLUMN height INTEGER",
+    "ALTER TABLE assets ADD COLUMN orientation INTEGER",
+    "ALTER TABLE assets ADD COLUMN colour_mode TEXT",
+    "ALTER TABLE assets ADD COLUMN duration_ms INTEGER",
+    "CREATE INDEX IF NOT EXISTS idx_assets_type_duration ON assets(type, duration_ms)",
+]
+
+
 async def get_db() -> aiosqlite.Connection:
     db = await aiosqlite.connect(str(DB_PATH))
     db.row_factory = aiosqlite.Row
     await db.execute("PRAGMA journal_mode=WAL")
     await db.execute("PRAGMA foreign_keys=ON")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    await db.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    await db.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
     return db
 
 
-async def get_db_dep():
-    db = await get_db()
-    try:
-        yield db
-    finally:
-        await db.close()
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Long-lived SQLite connections: one writer, serialised by a lock, and a set of readers.
+
+    WAL lets the readers run alongside the writer; funnelling every write through
+    one connection means writers queue here instead of spinning on SQLITE_BUSY.
+    Readers are opened query_only so a write on the wrong connection fails loudly.
+    """
+
+    def __init__(self, readers: int, acquire_timeout: float):
+        self.size = readers
+        self.acquire_timeout = acquire_timeout
+        self._readers: asyncio.Queue | None = None
+        self._all_readers: list[aiosqlite.Connection] = []
+        self._writer: aiosqlite.Connection | None = None
+        self._write_lock: asyncio.Lock | None = None
+        self._writer_busy = False
+        self.acquired = {"read": 0, "write": 0}
+        self.waits = {"read": 0, "write": 0}
+        self.timeouts = {"read": 0, "write": 0}
+        self._wait_ms = {"read": 0.0, "write": 0.0}
+
+    async def open(self):
+        self._readers = asyncio.Queue()
+        self._write_lock = asyncio.Lock()
+        self._writer = await get_db()
+        for _ in range(self.size):
+            db = await get_db()
+            await db.execute("PRAGMA query_only=ON")
+            self._all_readers.append(db)
+            self._readers.put_nowait(db)
+
+    async def close(self):
+        for db in self._all_readers:
+            await db.close()
+        self._all_readers.clear()
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+    def _record(self, kind: str, started: float, waited: bool):
+        self.acquired[kind] += 1
+        self._wait_ms[kind] += (time.perf_counter() - started) * 1000
+        if waited:
+            self.waits[kind] += 1
+
+    @asynccontextmanager
+    async def read(self):
+        started = time.perf_counter()
+        waited = self._readers.empty()
+        try:
+            db = await asyncio.wait_for(self._readers.get(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts["read"] += 1
+            raise PoolTimeout()
+        self._record("read", started, waited)
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def write(self):
+        started = time.perf_counter()
+        waited = self._write_lock.locked()
+        try:
+            await asyncio.wait_for(self._write_lock.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts["write"] += 1
+            raise PoolTimeout()
+        self._record("write", started, waited)
+        self._writer_busy = True
+        try:
+            yield self._writer
+        finally:
+            # Never hand the next writer someone else's half-finished transaction
+            if self._writer.in_transaction:
+                await self._writer.rollback()
+            self._writer_busy = False
+            self._write_lock.release()
+
+    def stats(self) -> dict:
+        idle = self._readers.qsize() if self._readers is not None else 0
+        return {
+            "readers": self.size,
+            "readers_in_use": self.size - idle if self._readers is not None else 0,
+            "writer_in_use": self._writer_busy,
+            "acquired": dict(self.acquired),
+            "waits": dict(self.waits),
+            "timeouts": dict(self.timeouts),
+            "avg_wait_ms": {
+                kind: round(self._wait_ms[kind] / self.acquired[kind], 3) if self.acquired[kind] else 0.0
+                for kind in self.acquired
+            },
+        }
+
+
+db_pool = ConnectionPool(DB_READERS, DB_ACQUIRE_TIMEOUT)
+
+_READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+async def get_db_dep(request: Request):
+    """Reader connection for safe methods, the shared writer for everything else."""
+    if request.method in _READ_METHODS:
+        async with db_pool.read() as db:
+            yield db
+    else:
+        async with db_pool.write() as db:
+            yield db
 
 
 async def init_db():
     db = await get_db()
     await db.executescript(SCHEMA)
+    row = await db.execute("PRAGMA user_version")
+    version = (await row.fetchone())[0]
+    for index, statement in enumerate(MIGRATIONS[version:], start=version + 1):
+        await db.execute(statement)
+        await db.execute(f"PRAGMA user_version = {index}")
     await db.commit()
     await db.close()
@@ -0,0 +1,97 @@
+import os
+import re
+import asyncio
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+# Every file served through here is addressed by its content, so it never changes
+IMMUTABLE = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 256 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+# _parse_range's answer for a valid range that lies wholly past the end of the file
+_UNSATISFIABLE = object()
+
+
+def _parse_range(header: str, size: int):
+    """(start, end) inclusive for a single satisfiable byte range.
+
+    None for a header that isn't a valid byte range (another unit, last before
+    first, garbage), which RFC 9110 says to ignore; _UNSATISFIABLE for a valid
+    one that starts at or past the end of the file.
+    """
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return _UNSATISFIABLE
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return _UNSATISFIABLE
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+async def _iter_range(path: str, start: int, end: int):
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+async def cached_file_response(request: Request, path: str, media_type: str, etag: str) -> Response:
+    """Serve an immutable file with ETag revalidation and single byte-range support.
+
+    If-None-Match answers 304 without touching the file. A Range request gets a
+    206 for its one range (multi-range and malformed requests get the whole file,
+    which RFC 9110 allows), unless If-Range names a different validator.
+    """
+    etag = f'"{etag}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE, "Accept-Ranges": "bytes"}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and "," not in range_header and (if_range is None or if_range.strip() == etag):
+        size = (await asyncio.to_thread(os.stat, path)).st_size
+        byte_range = _parse_range(range_header, size)
+        if byte_range is _UNSATISFIABLE:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            return StreamingResponse(
+                _iter_range(path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}",
+                         "Content-Length": str(end - start + 1)},
+            )
+
+    return FileResponse(path, media_type=media_type, headers=headers)
@@ -1,7 +1,13 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from api.database import init_db
+from fastapi.responses import JSONResponse, Response
+from api import metrics
+from api.database import init_db, db_pool, PoolTimeout
+from api.services.asset_index import asset_index
+from api.services.compositor import cache_stats
+from api.services.render_executor import render_executor
+from api.services.analysis_jobs import analysis_jobs
 from api.routers.assets import router as assets_router
 from api.routers.projects import router as projects_router
 from api.routers.profiles import router as profiles_router
@@ -11,7 +17,12 @@ from api.routers.compose import router as compose_router
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    await db_pool.open()
+    await analysis_jobs.resume()
     yield
+    await analysis_jobs.shutdown()
+    render_executor.shutdown()
+    await db_pool.close()
 
 
 app = FastAPI(title="Studio API", lifespan=lifespan)
@@ -21,7 +32,15 @@ app.add_middleware(
     allow_origin_regex=r"http://localhost:\d+",
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Range"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse({"detail": "Database busy, retry shortly"}, status_code=503)
+
 
 app.include_router(assets_router)
 app.include_router(projects_router)
@@ -31,4 +50,48 @@ app.include_router(compose_router)
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {"status": "ok", "db_pool": db_pool.stats()}
+
+
+def _component_stats():
+    caches = cache_stats()
+    pool = db_pool.stats()
+    executor = render_executor.stats()
+    return [
+        ("cache_entries", "gauge", "Entries held per in-process cache.",
+         [({"cache": name}, stats["entries"]) for name, stats in caches.items()]),
+        ("cache_bytes", "gauge", "Bytes held per byte-budgeted cache.",
+         [({"cache": name}, stats.get("bytes")) for name, stats in caches.items()]),
+        ("cache_hits_total", "counter", "Cache hits.",
+         [({"cache": name}, stats["hits"]) for name, stats in caches.items()]),
+        ("cache_misses_total", "counter", "Cache misses.",
+         [({"cache": name}, stats["misses"]) for name, stats in caches.items()]),
+        ("cache_evictions_total", "counter", "Entries evicted to stay within budget.",
+         [({"cache": name}, stats.get("evictions")) for name, stats in caches.items()]),
+        ("asset_index_entries", "gauge", "Asset ids resolved to files in memory.",
+         [({}, asset_index.stats()["entries"])]),
+        ("db_pool_connections", "gauge", "Pooled SQLite connections by role.",
+         [({"role": "reader"}, pool["readers"]), ({"role": "writer"}, 1)]),
+        ("db_pool_in_use", "gauge", "Pooled SQLite connections currently checked out.",
+         [({"role": "reader"}, pool["readers_in_use"]), ({"role": "writer"}, int(pool["writer_in_use"]))]),
+        ("db_pool_acquired_total", "counter", "Connection checkouts.",
+         [({"kind": kind}, n) for kind, n in pool["acquired"].items()]),
+        ("db_pool_waits_total", "counter", "Checkouts that had to wait for a connection.",
+         [({"kind": kind}, n) for kind, n in pool["waits"].items()]),
+        ("db_pool_timeouts_total", "counter", "Checkouts that gave up waiting.",
+         [({"kind": kind}, n) for kind, n in pool["timeouts"].items()]),
+        ("render_executor_workers", "gauge", "Render worker threads.", [({}, executor["workers"])]),
+        ("render_executor_running", "gauge", "Renders in progress.", [({}, executor["running"])]),
+        ("render_executor_queued", "gauge", "Renders waiting for a worker.", [({}, executor["queued"])]),
+        ("render_executor_renders_total", "counter", "Finished renders by outcome.",
+         [({"outcome": "completed"}, executor["completed"]), ({"outcome": "failed"}, executor["failed"]),
+          ({"outcome": "rejected"}, executor["rejected"])]),
+    ]
+
+
+metrics.register_collector(_component_stats)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,58 @@
+import json
+import base64
+import binascii
+from fastapi import HTTPException
+import aiosqlite
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(sort_value, row_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort_value, row_id
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
+def parse_fields(fields: str | None, allowed: tuple[str, ...]) -> list[str]:
+    """Columns named in a comma-separated fields parameter, or every allowed column."""
+    if not fields:
+        return list(allowed)
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in allowed]
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}")
+    return wanted
+
+
+async def keyset_page(db: aiosqlite.Connection, table: str, sort_column: str, columns: list[str],
+                      cursor: str | None, limit: int) -> tuple[list[dict], str | None]:
+    """One page of rows newest first by (sort_column, id), with the cursor for the next page.
+
+    Seeks past the cursor on the (sort_column, id) index rather than using OFFSET,
+    so every page costs the same however deep it is.
+    """
+    selected = list(dict.fromkeys([*columns, sort_column, "id"]))
+    sql = f"SELECT {', '.join(selected)} FROM {table}"
+    params: list = []
+    if cursor:
+        sql += f" WHERE ({sort_column}, id) < (?, ?)"
+        params.extend(decode_cursor(cursor))
+    sql += f" ORDER BY {sort_column} DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    rows = await db.execute(sql, params)
+    page = [dict(row) for row in await rows.fetchall()]
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1][sort_column], page[-1]["id"])
+    return [{c: row[c] for c in columns} for row in page], next_cursor
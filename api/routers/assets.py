@@ -1,10 +1,17 @@
 import uuid
 import json
+import asyncio
 from pathlib import Path
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, Request
 import aiosqlite
 from api.config import STORAGE_DIR
-from api.database import get_db_dep
+from api.database import get_db_dep, db_pool
+from api.http_cache import cached_file_response
+from api.services.asset_index import asset_index
+from api.services.blob_store import BLOB_DIR, blob_exists, store_blob, release_blob, delete_file
+from api.services.media_probe import probe_media, PROBE_FIELDS
+from api.services.renditions import generate_renditions
+from api.services.uploads import stage_upload, discard_upload, UploadTooLarge
 
 router = APIRouter(prefix="/assets", tags=["assets"])
 
@@ -24,45 +31,84 @@ for t in ALLOWED_AUDIO_TYPES:
 MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB
 
 
+async def _renditions(source: Path, sha256: str) -> list[dict]:
+    try:
+        return await asyncio.to_thread(generate_renditions, source, BLOB_DIR, sha256)
+    except OSError:
+        # A readable header with damaged pixel data; stored as before, served from the original
+        return []
+
+
 @router.post("/upload")
-async def upload_asset(file: UploadFile = File(...), db: aiosqlite.Connection = Depends(get_db_dep)):
+async def upload_asset(file: UploadFile = File(...)):
     if file.content_type not in MIME_TO_ASSET_TYPE:
         raise HTTPException(400, f"Unsupported file type: {file.content_type}")
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="File too large (max 50MB)")
 
     asset_type = MIME_TO_ASSET_TYPE[file.content_type]
     asset_id = str(uuid.uuid4())
     ext = Path(file.filename or "file").suffix
-    storage_path = STORAGE_DIR / asset_type / f"{asset_id}{ext}"
-    storage_path.parent.mkdir(parents=True, exist_ok=True)
 
-    content = await file.read()
-    if len(content) > MAX_UPLOAD_SIZE:
+    try:
+        staged = await stage_upload(file, MAX_UPLOAD_SIZE)
+    except UploadTooLarge:
         raise HTTPException(status_code=413, detail="File too large (max 50MB)")
-    storage_path.write_bytes(content)
-
-    metadata = {"original_filename": file.filename}
-    if asset_type == "image":
-        from PIL import Image
-        img = Image.open(storage_path)
-        metadata["width"] = img.width
-        metadata["height"] = img.height
-        metadata["path"] = str(storage_path)
-        img.close()
-
-    await db.execute(
-        """INSERT INTO assets (id, type, path, filename, mime_type, size_bytes, metadata)
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (asset_id, asset_type, str(storage_path), file.filename or "file",
-         file.content_type, len(content), json.dumps(metadata)),
-    )
-    await db.commit()
+
+    # Any failure removes the staged file; once store_blob has moved it this is a no-op
+    try:
+        # Content we already hold was probed when it was first stored
+        media, renditions = None, []
+        if not await blob_exists(staged.sha256):
+            media = await asyncio.to_thread(probe_media, str(staged.path), file.content_type)
+            if asset_type == "image":
+                if media["width"] is None:
+                    raise HTTPException(400, "Could not read image")
+                renditions = await _renditions(staged.path, staged.sha256)
+
+        # The writer is only taken once the body is staged; it also serialises blob creation
+        async with db_pool.write() as db:
+            storage_path, existing = await store_blob(db, staged, ext)
+            if existing is not None:
+                metadata = {**existing["metadata"], "original_filename": file.filename}
+                media = existing["media"]
+            else:
+                if media is None:
+                    # The blob was deleted between the check and the store; do what the check skipped
+                    media = await asyncio.to_thread(probe_media, storage_path, file.content_type)
+                    if asset_type == "image":
+                        renditions = await _renditions(Path(storage_path), staged.sha256)
+                metadata = {"original_filename": file.filename, "sha256": staged.sha256}
+                if asset_type == "image":
+                    # Kept in metadata as well for the frontend, which reads them from there
+                    metadata["width"] = media["width"]
+                    metadata["height"] = media["height"]
+                    metadata["path"] = storage_path
+                    metadata["renditions"] = renditions
+
+            await db.execute(
+                f"""INSERT INTO assets (id, type, path, filename, mime_type, size_bytes, metadata, blob_sha256,
+                                        {', '.join(PROBE_FIELDS)})
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, {', '.join('?' * len(PROBE_FIELDS))})""",
+                (asset_id, asset_type, storage_path, file.filename or "file",
+                 file.content_type, staged.size, json.dumps(metadata), staged.sha256,
+                 *(media[field] for field in PROBE_FIELDS)),
+            )
+            await db.commit()
+    except BaseException:
+        await discard_upload(staged)
+        raise
+
+    asset_index.register(asset_id, storage_path, file.content_type, staged.sha256, metadata.get("renditions"))
 
     return {
         "id": asset_id,
         "type": asset_type,
         "filename": file.filename,
-        "size_bytes": len(content),
+        "size_bytes": staged.size,
+        **media,
         "metadata": metadata,
+        "deduplicated": existing is not None,
     }
 
 
@@ -82,17 +128,56 @@ async def get_asset(asset_id: str, db: aiosqlite.Connection = Depends(get_db_dep
 
 
 @router.get("/{asset_id}/file")
-async def serve_asset(asset_id: str, db: aiosqlite.Connection = Depends(get_db_dep)):
-    from fastapi.responses import FileResponse
-
-    row = await db.execute("SELECT path, mime_type FROM assets WHERE id = ?", (asset_id,))
-    asset = await row.fetchone()
+async def serve_asset(asset_id: str, request: Request, size: int | None = Query(None, gt=0)):
+    # Served from the in-memory index; the database is only read on a miss
+    asset = await asset_index.lookup(asset_id)
 
     if not asset:
         raise HTTPException(404, "Asset not found")
 
-    resolved = Path(asset["path"]).resolve()
+    path, media_type = asset.path, asset.mime_type
+    etag = asset.sha256
+    if size is not None:
+        # Smallest rendition whose longest edge reaches the requested size, else the original
+        renditions = asset_index.renditions(asset.path)
+        chosen = next((r for r in renditions if max(r["width"], r["height"]) >= size), None)
+        if chosen is not None:
+            path, media_type = chosen["path"], "image/webp"
+            etag = etag and f"{etag}@{chosen['size']}"
+
+    resolved = Path(path).resolve()
     if not str(resolved).startswith(str(STORAGE_DIR.resolve())):
         raise HTTPException(status_code=403, detail="Access denied")
+    if not await asyncio.to_thread(resolved.is_file):
+        raise HTTPException(404, "Asset file missing")
+
+    if etag is None:
+        # Uploaded before content hashes were recorded
+        stat = await asyncio.to_thread(resolved.stat)
+        etag = f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+    return await cached_file_response(request, path, media_type, etag)
+
+
+@router.delete("/{asset_id}")
+async def delete_asset(asset_id: str, db: aiosqlite.Connection = Depends(get_db_dep)):
+    row = await db.execute("SELECT path, blob_sha256, metadata FROM assets WHERE id = ?", (asset_id,))
+    asset = await row.fetchone()
+
+    if not asset:
+        raise HTTPException(404, "Asset not found")
+
+    await db.execute("DELETE FROM assets WHERE id = ?", (asset_id,))
+    if asset["blob_sha256"]:
+        orphaned = await release_blob(db, asset["blob_sha256"])
+    else:
+        orphaned = asset["path"]
+    await db.commit()
+    asset_index.invalidate(asset_id)
+
+    # Still under the writer, so an identical upload can't recreate the blob meanwhile
+    if orphaned:
+        await delete_file(orphaned)
+        for rendition in json.loads(asset["metadata"]).get("renditions", []):
+            await delete_file(rendition["path"])
 
-    return FileResponse(asset["path"], media_type=asset["mime_type"])
+    return {"id": asset_id, "status": "deleted"}
@@ -1,9 +1,21 @@
 import re
-import uuid
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, Field
-from api.services.compositor import compose_zones
+import json
+import asyncio
+import hashlib
+import tempfile
+import zipfile
+from pathlib import Path
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import Literal
+from pydantic import BaseModel, Field, model_validator
+from api.database import db_pool
+from api.http_cache import cached_file_response
+from api.services.asset_index import asset_index
+from api.services.compositor import render_to_file, cache_stats
+from api.services.encoding import FORMATS
+from api.services.render_executor import render_executor, ExecutorSaturated
+from api.services.render_jobs import render_jobs, JobLimitReached, TERMINAL_STATUSES
 from api.config import STORAGE_DIR
 
 router = APIRouter(prefix="/compose", tags=["compose"])
@@ -22,36 +34,311 @@ class ZoneInput(BaseModel):
     zone_order: int = 0
 
 
+class OutputOptions(BaseModel):
+    format: Literal["png", "webp", "jpeg"] = "png"
+    quality: int = Field(90, ge=1, le=100)
+    lossless: bool = False
+    # None lets the renderer choose: 6, or 1 for previews
+    compress_level: int | None = Field(None, ge=0, le=9)
+    target_bytes: int | None = Field(None, gt=0)
+
+    @model_validator(mode="after")
+    def _check_target(self):
+        if self.target_bytes and (self.format == "png" or self.lossless):
+            raise ValueError("target_bytes requires a lossy format (jpeg, or webp without lossless)")
+        return self
+
+
 class ComposeRequest(BaseModel):
     project_id: str
     canvas_width: int = Field(gt=0, le=8192)
     canvas_height: int = Field(gt=0, le=8192)
     zones: list[ZoneInput]
+    preview: bool = False
+    preview_scale: float = Field(0.25, gt=0, le=1)
+    refine: bool = False
+    output: OutputOptions = OutputOptions()
 
 
-@router.post("/render")
-async def render_composition(req: ComposeRequest):
-    zones_dicts = [z.model_dump() for z in req.zones]
-    canvas = compose_zones(zones_dicts, req.canvas_width, req.canvas_height)
+class ZoneOverride(BaseModel):
+    zone_index: int = Field(ge=0)
+    content: dict = {}
+    bounds: ZoneBounds | None = None
+
+
+class RenderVariant(BaseModel):
+    name: str | None = None
+    canvas_width: int | None = Field(None, gt=0, le=8192)
+    canvas_height: int | None = Field(None, gt=0, le=8192)
+    overrides: list[ZoneOverride] = []
+
+
+class BatchRenderRequest(BaseModel):
+    base: ComposeRequest
+    variants: list[RenderVariant] = Field(min_length=1, max_length=100)
+    archive: bool = False
+
+
+def _image_asset_ids(req: ComposeRequest) -> set[str]:
+    return {
+        z.content["asset_id"] for z in req.zones
+        if z.content.get("type") == "image" and z.content.get("asset_id")
+    }
+
 
+def render_key(req: ComposeRequest, asset_paths: dict[str, Path]) -> str:
+    """Content hash of everything that affects the rendered pixels."""
+    zones = sorted(req.zones, key=lambda z: z.zone_order)
+    assets = {}
+    for asset_id in sorted(_image_asset_ids(req)):
+        path = asset_paths.get(asset_id)
+        assets[asset_id] = [path.name, path.stat().st_mtime_ns] if path and path.exists() else None
+
+    payload = {
+        "canvas": [req.canvas_width, req.canvas_height],
+        "preview": req.preview_scale if req.preview else None,
+        "output": req.output.model_dump(),
+        "zones": [z.model_dump() for z in zones],
+        "assets": assets,
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _output_path(output_id: str, output: OutputOptions) -> Path:
     output_dir = STORAGE_DIR / "renders"
     output_dir.mkdir(parents=True, exist_ok=True)
-    output_id = str(uuid.uuid4())
-    output_path = output_dir / f"{output_id}.png"
-    canvas.save(str(output_path), "PNG", quality=95)
+    return output_dir / f"{output_id}{FORMATS[output.format][2]}"
 
-    return {
+
+def _cached_report(output_path: Path, output: OutputOptions) -> dict:
+    return {"format": output.format, "bytes": output_path.stat().st_size}
+
+
+@router.post("/render")
+async def render_composition(req: ComposeRequest):
+    # The reader is held only for the lookup, never across a render
+    async with db_pool.read() as db:
+        asset_paths = await asset_index.resolve(db, _image_asset_ids(req))
+    output_id = render_key(req, asset_paths)
+    output_path = _output_path(output_id, req.output)
+    scale = req.preview_scale if req.preview else 1.0
+
+    cached = output_path.exists()
+    if cached:
+        report, timing = _cached_report(output_path, req.output), {}
+    else:
+        zones_dicts = [z.model_dump() for z in req.zones]
+        try:
+            report, timing = await render_executor.run(
+                render_to_file, zones_dicts, req.canvas_width, req.canvas_height, output_path,
+                scale=scale, preview=req.preview, asset_paths=asset_paths,
+                output=req.output.model_dump(),
+            )
+        except ExecutorSaturated:
+            raise HTTPException(429, "Render queue is full, retry shortly", headers={"Retry-After": "1"})
+
+    result = {
         "render_id": output_id,
-        "width": req.canvas_width,
-        "height": req.canvas_height,
+        "width": max(1, round(req.canvas_width * scale)),
+        "height": max(1, round(req.canvas_height * scale)),
+        "cached": cached,
+        "preview": req.preview,
+        **timing,
+        **report,
     }
+    if req.preview and req.refine:
+        # Queue the full-quality render; clients follow it via /compose/jobs/{job_id}
+        full_req = req.model_copy(update={"preview": False, "refine": False})
+        try:
+            job = _submit_job(full_req, asset_paths)
+            result["refine_job_id"] = job.id
+        except JobLimitReached:
+            result["refine_job_id"] = None
+    return result
 
 
 @router.get("/render/{render_id}")
-async def get_render(render_id: str):
+async def get_render(render_id: str, request: Request):
     if not re.match(r'^[a-f0-9\-]+$', render_id):
         raise HTTPException(status_code=400, detail="Invalid render ID")
-    output_path = STORAGE_DIR / "renders" / f"{render_id}.png"
-    if not output_path.exists():
-        raise HTTPException(404, "Render not found")
-    return FileResponse(str(output_path), media_type="image/png")
+    for fmt, (_, media_type, ext) in FORMATS.items():
+        output_path = STORAGE_DIR / "renders" / f"{render_id}{ext}"
+        if output_path.exists():
+            # Render ids hash every input, so the id identifies the bytes
+            return await cached_file_response(request, str(output_path), media_type, f"{render_id}.{fmt}")
+    raise HTTPException(404, "Render not found")
+
+
+def _submit_job(req: ComposeRequest, asset_paths: dict[str, Path]):
+    output_id = render_key(req, asset_paths)
+    zones_dicts = [z.model_dump() for z in req.zones]
+    return render_jobs.submit(
+        req.project_id, output_id, zones_dicts, req.canvas_width, req.canvas_height,
+        _output_path(output_id, req.output), asset_paths, req.output.model_dump(),
+    )
+
+
+def _apply_variant(base: ComposeRequest, variant: RenderVariant) -> ComposeRequest:
+    """Merge per-zone overrides into the base request, rescaling zones for a new format."""
+    width = variant.canvas_width or base.canvas_width
+    height = variant.canvas_height or base.canvas_height
+    sx, sy = width / base.canvas_width, height / base.canvas_height
+
+    zones = []
+    for zone in base.zones:
+        b = zone.bounds
+        bounds = ZoneBounds(x=round(b.x * sx), y=round(b.y * sy),
+                            width=max(1, round(b.width * sx)), height=max(1, round(b.height * sy)))
+        zones.append(ZoneInput(bounds=bounds, content=dict(zone.content), zone_order=zone.zone_order))
+
+    for override in variant.overrides:
+        if override.zone_index >= len(zones):
+            raise HTTPException(400, f"Override references unknown zone {override.zone_index}")
+        zone = zones[override.zone_index]
+        zone.content.update(override.content)
+        if override.bounds:
+            zone.bounds = override.bounds
+
+    return base.model_copy(update={
+        "canvas_width": width, "canvas_height": height, "zones": zones,
+        "preview": False, "refine": False,
+    })
+
+
+@router.post("/batch")
+async def render_batch(req: BatchRenderRequest):
+    variant_reqs = [_apply_variant(req.base, v) for v in req.variants]
+    asset_ids = set().union(*(_image_asset_ids(v) for v in variant_reqs))
+    async with db_pool.read() as db:
+        asset_paths = await asset_index.resolve(db, asset_ids)
+
+    # Variants share the process-wide asset, font and layer caches, so a swapped
+    # headline only re-rasterises that text layer. Keep at most one render per worker
+    # in flight so a large batch does not starve interactive requests.
+    slots = asyncio.Semaphore(render_executor.workers)
+
+    async def render_variant(index: int, variant_req: ComposeRequest) -> dict:
+        output_id = render_key(variant_req, asset_paths)
+        output_path = _output_path(output_id, variant_req.output)
+        entry = {
+            "name": req.variants[index].name or f"variant-{index + 1}",
+            "render_id": output_id,
+            "file": output_path.name,
+            "width": variant_req.canvas_width,
+            "height": variant_req.canvas_height,
+            "cached": output_path.exists(),
+        }
+        if entry["cached"]:
+            return {**entry, **_cached_report(output_path, variant_req.output)}
+        zones_dicts = [z.model_dump() for z in variant_req.zones]
+        async with slots:
+            while True:
+                try:
+                    report, timing = await render_executor.run(
+                        render_to_file, zones_dicts, variant_req.canvas_width, variant_req.canvas_height,
+                        output_path, asset_paths=asset_paths, output=variant_req.output.model_dump(),
+                    )
+                    break
+                except ExecutorSaturated:
+                    await asyncio.sleep(0.5)
+        return {**entry, **timing, **report}
+
+    results = await asyncio.gather(*(render_variant(i, v) for i, v in enumerate(variant_reqs)))
+
+    if not req.archive:
+        return {"variants": results}
+
+    archive = await asyncio.to_thread(_build_archive, results, STORAGE_DIR / "renders")
+    return StreamingResponse(
+        _iter_file(archive), media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="variants.zip"'},
+    )
+
+
+def _build_archive(results: list[dict], output_dir: Path):
+    spool = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    # Encoded images are already compressed; storing avoids a second pass
+    with zipfile.ZipFile(spool, "w", compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr("manifest.json", json.dumps({"variants": results}, indent=2))
+        used = set()
+        for entry in results:
+            name = re.sub(r"[^\w.-]+", "_", entry["name"])
+            while name in used:
+                name += "_"
+            used.add(name)
+            zf.write(output_dir / entry["file"], f"{name}{Path(entry['file']).suffix}")
+    spool.seek(0)
+    return spool
+
+
+async def _iter_file(f, chunk_size: int = 1024 * 1024):
+    try:
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+    finally:
+        f.close()
+
+
+@router.post("/jobs", status_code=202)
+async def submit_render_job(req: ComposeRequest):
+    if req.preview:
+        raise HTTPException(400, "Preview renders are synchronous; use POST /compose/render")
+    async with db_pool.read() as db:
+        asset_paths = await asset_index.resolve(db, _image_asset_ids(req))
+    try:
+        job = _submit_job(req, asset_paths)
+    except JobLimitReached:
+        raise HTTPException(429, "Too many active render jobs for this project")
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}")
+async def get_render_job(job_id: str):
+    job = render_jobs.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_render_job(job_id: str):
+    job = render_jobs.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+
+    async def events():
+        queue = job.subscribe()
+        try:
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {payload['event']}\ndata: {json.dumps(payload)}\n\n"
+                if payload["status"] in TERMINAL_STATUSES:
+                    break
+        finally:
+            job.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_render_job(job_id: str):
+    job = render_jobs.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    render_jobs.cancel(job)
+    return job.to_dict()
+
+
+@router.get("/stats")
+async def compose_stats():
+    return {
+        "cache": {**cache_stats(), "asset_index": asset_index.stats()},
+        "executor": render_executor.stats(),
+        "db_pool": db_pool.stats(),
+    }
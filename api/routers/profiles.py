@@ -1,19 +1,35 @@
 import uuid
 import json
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import aiosqlite
-from api.database import get_db_dep
-from api.services.style_extraction import extract_colours, analyze_with_vision, synthesize_profile
+from api.database import get_db_dep, db_pool
+from api.pagination import keyset_page, parse_fields, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from api.services.analysis_jobs import analysis_jobs, get_job, TERMINAL_STATUSES
+from api.services.profile_analysis import (
+    analyze_images, save_analysis, add_image, remove_image, ProfileConflict,
+)
 
 router = APIRouter(prefix="/profiles", tags=["profiles"])
 
+PROFILE_FIELDS = (
+    "id", "name", "colours", "typography", "composition", "textures", "mood",
+    "source_images", "version", "created_at", "updated_at",
+)
+JSON_FIELDS = ("colours", "typography", "composition", "textures", "mood", "source_images")
+
 
 class CreateProfileRequest(BaseModel):
     name: str
     source_image_paths: list[str]
 
 
+class AddImageRequest(BaseModel):
+    image_path: str
+
+
 @router.post("/")
 async def create_profile(req: CreateProfileRequest, db: aiosqlite.Connection = Depends(get_db_dep)) -> dict:
     profile_id = str(uuid.uuid4())
@@ -26,9 +42,11 @@ async def create_profile(req: CreateProfileRequest, db: aiosqlite.Connection = D
 
 
 @router.post("/{profile_id}/analyze")
-async def analyze_profile(profile_id: str, db: aiosqlite.Connection = Depends(get_db_dep)) -> dict:
-    row = await db.execute("SELECT * FROM style_profiles WHERE id = ?", (profile_id,))
-    profile = await row.fetchone()
+async def analyze_profile(profile_id: str) -> dict:
+    # No connection is held across the analysis; the pool is used per statement group
+    async with db_pool.read() as db:
+        row = await db.execute("SELECT * FROM style_profiles WHERE id = ?", (profile_id,))
+        profile = await row.fetchone()
     if not profile:
         raise HTTPException(404, "Profile not found")
 
@@ -36,84 +54,119 @@ async def analyze_profile(profile_id: str, db: aiosqlite.Connection = Depends(ge
     if not source_images:
         raise HTTPException(400, "No source images to analyze")
 
-    colour_results = []
-    vision_results = []
+    colour_results, vision_results = await analyze_images(source_images, cache=True)
 
-    for img_path in source_images:
-        try:
-            colours = extract_colours(img_path)
-            colour_results.append(colours)
-        except Exception as e:
-            colour_results.append({"primary": [], "accent": [], "background": [], "text": [], "error": str(e)})
-        try:
-            vision = analyze_with_vision(img_path)
-            vision_results.append(vision)
-        except Exception as e:
-            vision_results.append({"error": str(e)})
+    async with db_pool.write() as db:
+        synthesized = await save_analysis(db, profile_id, source_images, colour_results, vision_results)
+    if synthesized is None:
+        raise HTTPException(500, "All image analyses failed")
 
-    valid_vision = [v for v in vision_results if "error" not in v]
-    valid_colours = [c for c in colour_results if "error" not in c]
+    return {"id": profile_id, "status": "analyzed", "profile": synthesized}
 
-    if not valid_vision and not valid_colours:
-        raise HTTPException(500, "All image analyses failed")
 
-    # If no valid vision results, create a minimal profile from colours only
-    if not valid_vision:
-        synthesized = {
-            "colours": {"primary": [], "accent": [], "background": [], "text": []},
-            "typography": {
-                "headline": {"family": "Inter", "weight": 700, "size_ratio": 2.5},
-                "body": {"family": "Inter", "weight": 400, "size_ratio": 1.0},
-                "accent": {"family": "Inter", "weight": 400, "size_ratio": 1.5},
-                "caption": {"family": "Inter", "weight": 400, "size_ratio": 0.75},
-            },
-            "composition": {"text_image_ratio": 0.3, "alignment": ["centre"], "whitespace": 0.5, "density": 0.0},
-            "textures": {"grain_intensity": 0.0, "contrast": 0.5, "halftone": False, "pattern_density": 0.0},
-            "mood": {"warmth": 0.0, "density": 0.0, "brightness": 0.0, "formality": 0.0},
-        }
-        if valid_colours:
-            from collections import Counter
-            all_primary = [c for r in valid_colours for c in r.get("primary", [])]
-            all_accent = [c for r in valid_colours for c in r.get("accent", [])]
-            all_bg = [c for r in valid_colours for c in r.get("background", [])]
-            all_text = [c for r in valid_colours for c in r.get("text", [])]
-
-            def most_common(lst, n=4):
-                return [c for c, _ in Counter(lst).most_common(n)]
-
-            synthesized["colours"] = {
-                "primary": most_common(all_primary),
-                "accent": most_common(all_accent),
-                "background": most_common(all_bg),
-                "text": most_common(all_text),
-            }
-    else:
-        synthesized = synthesize_profile(valid_vision, valid_colours)
+@router.post("/{profile_id}/images")
+async def add_profile_image(profile_id: str, req: AddImageRequest) -> dict:
+    async with db_pool.read() as db:
+        row = await db.execute("SELECT id FROM style_profiles WHERE id = ?", (profile_id,))
+        found = await row.fetchone()
+    if not found:
+        raise HTTPException(404, "Profile not found")
 
-    await db.execute(
-        """UPDATE style_profiles SET
-           colours = ?, typography = ?, composition = ?,
-           textures = ?, mood = ?, updated_at = datetime('now')
-           WHERE id = ?""",
-        (json.dumps(synthesized["colours"]), json.dumps(synthesized["typography"]),
-         json.dumps(synthesized["composition"]), json.dumps(synthesized["textures"]),
-         json.dumps(synthesized["mood"]), profile_id),
-    )
-    await db.commit()
+    try:
+        synthesized = await add_image(profile_id, req.image_path)
+    except ProfileConflict:
+        raise HTTPException(409, "Profile is being updated concurrently")
+    if synthesized is None:
+        raise HTTPException(500, "Image analysis failed")
 
     return {"id": profile_id, "status": "analyzed", "profile": synthesized}
 
 
+@router.delete("/{profile_id}/images")
+async def remove_profile_image(profile_id: str, image_path: str) -> dict:
+    async with db_pool.read() as db:
+        row = await db.execute("SELECT id FROM style_profiles WHERE id = ?", (profile_id,))
+        found = await row.fetchone()
+    if not found:
+        raise HTTPException(404, "Profile not found")
+
+    try:
+        synthesized = await remove_image(profile_id, image_path)
+    except ProfileConflict:
+        raise HTTPException(409, "Profile is being updated concurrently")
+    if synthesized is None:
+        raise HTTPException(404, "Image not in profile")
+
+    return {"id": profile_id, "status": "analyzed", "profile": synthesized}
+
+
+@router.post("/{profile_id}/jobs", status_code=202)
+async def start_analysis_job(profile_id: str, db: aiosqlite.Connection = Depends(get_db_dep)) -> dict:
+    row = await db.execute("SELECT source_images FROM style_profiles WHERE id = ?", (profile_id,))
+    profile = await row.fetchone()
+    if not profile:
+        raise HTTPException(404, "Profile not found")
+
+    source_images = json.loads(profile["source_images"])
+    if not source_images:
+        raise HTTPException(400, "No source images to analyze")
+
+    job_id = await analysis_jobs.enqueue(db, profile_id, source_images)
+    return await get_job(db, job_id)
+
+
+@router.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str, db: aiosqlite.Connection = Depends(get_db_dep)) -> dict:
+    job = await get_job(db, job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str, db: aiosqlite.Connection = Depends(get_db_dep)):
+    # Subscribe before reading the snapshot, so an update published while it is
+    # being read is queued rather than missed
+    queue = analysis_jobs.subscribe(job_id)
+    try:
+        job = await get_job(db, job_id)
+        if not job:
+            raise HTTPException(404, "Job not found")
+    except BaseException:
+        analysis_jobs.unsubscribe(job_id, queue)
+        raise
+
+    async def events():
+        try:
+            current = job
+            while True:
+                yield f"event: {current['status']}\ndata: {json.dumps(current)}\n\n"
+                if current["status"] in TERMINAL_STATUSES:
+                    break
+                try:
+                    current = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            analysis_jobs.unsubscribe(job_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
 @router.get("/")
-async def list_profiles(db: aiosqlite.Connection = Depends(get_db_dep)):
-    rows = await db.execute("SELECT * FROM style_profiles ORDER BY updated_at DESC")
-    profiles = []
-    async for row in rows:
-        p = dict(row)
-        for field in ("colours", "typography", "composition", "textures", "mood", "source_images"):
+async def list_profiles(response: Response, cursor: str | None = None,
+                        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        fields: str | None = None, db: aiosqlite.Connection = Depends(get_db_dep)):
+    profiles, next_cursor = await keyset_page(
+        db, "style_profiles", "updated_at", parse_fields(fields, PROFILE_FIELDS), cursor, limit
+    )
+    for p in profiles:
+        for field in JSON_FIELDS:
             if isinstance(p.get(field), str):
                 p[field] = json.loads(p[field])
-        profiles.append(p)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return profiles
 
 
@@ -124,7 +177,8 @@ async def get_profile(profile_id: str, db: aiosqlite.Connection = Depends(get_db
     if not profile:
         raise HTTPException(404, "Profile not found")
     p = dict(profile)
-    for field in ("colours", "typography", "composition", "textures", "mood", "source_images"):
+    p.pop("stats", None)
+    for field in JSON_FIELDS:
         if isinstance(p.get(field), str):
             p[field] = json.loads(p[field])
     return p
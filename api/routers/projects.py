@@ -1,9 +1,10 @@
 import uuid
 import json
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from pydantic import BaseModel
 import aiosqlite
 from api.database import get_db_dep
+from api.pagination import keyset_page, parse_fields, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
@@ -40,6 +41,11 @@ VIDEO_STEPS = [
     {"step_number": 9, "name": "Export", "type": "export", "status": "pending", "input": {}, "output": {}, "user_overrides": {}},
 ]
 
+PROJECT_FIELDS = (
+    "id", "name", "style_profile_id", "pipeline_type", "status", "brief",
+    "reference_images", "format", "created_at", "updated_at",
+)
+
 PIPELINE_STEPS = {
     "static": STATIC_STEPS,
     "photo_direction": PHOTO_STEPS,
@@ -79,9 +85,14 @@ async def create_project(req: CreateProjectRequest, db: aiosqlite.Connection = D
 
 
 @router.get("/")
-async def list_projects(db: aiosqlite.Connection = Depends(get_db_dep)):
-    rows = await db.execute("SELECT * FROM projects ORDER BY created_at DESC")
-    projects = [dict(row) async for row in rows]
+async def list_projects(response: Response, cursor: str | None = None,
+                        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        fields: str | None = None, db: aiosqlite.Connection = Depends(get_db_dep)):
+    projects, next_cursor = await keyset_page(
+        db, "projects", "created_at", parse_fields(fields, PROJECT_FIELDS), cursor, limit
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return projects
 
 
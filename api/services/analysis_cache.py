@@ -0,0 +1,67 @@
+import json
+import hashlib
+import aiosqlite
+from api.config import ANALYSIS_CACHE_TTL_DAYS, ANALYSIS_CACHE_MAX_BYTES
+from api.services.style_extraction import VISION_MODEL, VISION_PROMPT
+
+# Bump when extract_colours changes in a way that alters its output
+COLOUR_VERSION = "kmeans-3"
+VISION_VERSION = hashlib.sha256(f"{VISION_MODEL}\n{VISION_PROMPT}".encode()).hexdigest()[:12]
+
+_VERSIONS = {"colours": COLOUR_VERSION, "vision": VISION_VERSION}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(image_sha256: str, kind: str) -> str:
+    return f"{image_sha256}:{kind}:{_VERSIONS[kind]}"
+
+
+async def get(db: aiosqlite.Connection, image_sha256: str, kind: str) -> dict | None:
+    key = cache_key(image_sha256, kind)
+    row = await db.execute(
+        "SELECT value FROM analysis_cache WHERE key = ? AND created_at > datetime('now', ?)",
+        (key, f"-{ANALYSIS_CACHE_TTL_DAYS} days"),
+    )
+    found = await row.fetchone()
+    if not found:
+        return None
+    await db.execute("UPDATE analysis_cache SET last_used_at = datetime('now') WHERE key = ?", (key,))
+    await db.commit()
+    return json.loads(found["value"])
+
+
+async def put(db: aiosqlite.Connection, image_sha256: str, kind: str, value: dict):
+    encoded = json.dumps(value)
+    await db.execute(
+        """INSERT OR REPLACE INTO analysis_cache (key, kind, value, size_bytes)
+           VALUES (?, ?, ?, ?)""",
+        (cache_key(image_sha256, kind), kind, encoded, len(encoded)),
+    )
+    await db.commit()
+
+
+async def evict(db: aiosqlite.Connection):
+    """Drop expired entries, then least-recently-used ones until under the size budget."""
+    await db.execute(
+        "DELETE FROM analysis_cache WHERE created_at <= datetime('now', ?)",
+        (f"-{ANALYSIS_CACHE_TTL_DAYS} days",),
+    )
+    row = await db.execute("SELECT COALESCE(SUM(size_bytes), 0) AS total FROM analysis_cache")
+    total = (await row.fetchone())["total"]
+    if total > ANALYSIS_CACHE_MAX_BYTES:
+        rows = await db.execute("SELECT key, size_bytes FROM analysis_cache ORDER BY last_used_at, key")
+        doomed = []
+        async for entry in rows:
+            if total <= ANALYSIS_CACHE_MAX_BYTES:
+                break
+            doomed.append((entry["key"],))
+            total -= entry["size_bytes"]
+        await db.executemany("DELETE FROM analysis_cache WHERE key = ?", doomed)
+    await db.commit()
@@ -0,0 +1,148 @@
+import json
+import uuid
+import asyncio
+import aiosqlite
+from api.config import ANALYSIS_JOB_CONCURRENCY
+from api.database import db_pool
+from api.services.profile_analysis import analyze_images, save_analysis
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+
+class AnalysisJobRunner:
+    """Runs profile analysis in-process from jobs persisted in SQLite.
+
+    Each finished image is written to analysis_job_items as it arrives, so a job
+    interrupted by a restart resumes with only its pending images.
+    """
+
+    def __init__(self, concurrency: int):
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._subscribers: dict[str, list[asyncio.Queue]] = {}
+
+    async def enqueue(self, db: aiosqlite.Connection, profile_id: str, image_paths: list[str]) -> str:
+        job_id = str(uuid.uuid4())
+        await db.execute(
+            "INSERT INTO analysis_jobs (id, profile_id, total) VALUES (?, ?, ?)",
+            (job_id, profile_id, len(image_paths)),
+        )
+        await db.executemany(
+            "INSERT INTO analysis_job_items (job_id, position, image_path) VALUES (?, ?, ?)",
+            [(job_id, i, path) for i, path in enumerate(image_paths)],
+        )
+        await db.commit()
+        self._schedule(job_id)
+        return job_id
+
+    async def resume(self):
+        async with db_pool.read() as db:
+            rows = await db.execute(
+                "SELECT id FROM analysis_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            )
+            for row in await rows.fetchall():
+                self._schedule(row["id"])
+
+    async def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(job_id, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self._subscribers.pop(job_id, None)
+
+    def _publish(self, job: dict):
+        for queue in self._subscribers.get(job["job_id"], []):
+            queue.put_nowait(job)
+
+    def _schedule(self, job_id: str):
+        if job_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str):
+        async with self._slots:
+            try:
+                await self._process(job_id)
+            except Exception as e:
+                async with db_pool.write() as db:
+                    await db.execute(
+                        "UPDATE analysis_jobs SET status = 'failed', error = ?, updated_at = datetime('now') WHERE id = ?",
+                        (str(e), job_id),
+                    )
+                    await db.commit()
+                    self._publish(await get_job(db, job_id))
+
+    async def _process(self, job_id: str):
+        # The pool's writer is taken per update, never across the vision calls
+        async with db_pool.write() as db:
+            await db.execute(
+                "UPDATE analysis_jobs SET status = 'running', updated_at = datetime('now') WHERE id = ?", (job_id,)
+            )
+            await db.commit()
+            rows = await db.execute(
+                "SELECT position, image_path FROM analysis_job_items WHERE job_id = ? AND status = 'pending' ORDER BY position",
+                (job_id,),
+            )
+            pending = [(row["position"], row["image_path"]) for row in await rows.fetchall()]
+
+        async def on_result(index: int, colours: dict, vision: dict):
+            async with db_pool.write() as db:
+                await db.execute(
+                    """UPDATE analysis_job_items SET status = 'done', colours = ?, vision = ?
+                       WHERE job_id = ? AND position = ?""",
+                    (json.dumps(colours), json.dumps(vision), job_id, pending[index][0]),
+                )
+                await db.execute(
+                    "UPDATE analysis_jobs SET completed = completed + 1, updated_at = datetime('now') WHERE id = ?",
+                    (job_id,),
+                )
+                await db.commit()
+                self._publish(await get_job(db, job_id))
+
+        if pending:
+            await analyze_images([path for _, path in pending], cache=True, on_result=on_result)
+
+        async with db_pool.write() as db:
+            rows = await db.execute(
+                "SELECT image_path, colours, vision FROM analysis_job_items WHERE job_id = ? ORDER BY position", (job_id,)
+            )
+            items = await rows.fetchall()
+            row = await db.execute("SELECT profile_id FROM analysis_jobs WHERE id = ?", (job_id,))
+            synthesized = await save_analysis(
+                db, (await row.fetchone())["profile_id"],
+                [item["image_path"] for item in items],
+                [json.loads(item["colours"]) for item in items],
+                [json.loads(item["vision"]) for item in items],
+            )
+            if synthesized is None:
+                raise RuntimeError("All image analyses failed")
+            await db.execute(
+                "UPDATE analysis_jobs SET status = 'completed', updated_at = datetime('now') WHERE id = ?", (job_id,)
+            )
+            await db.commit()
+            self._publish(await get_job(db, job_id))
+
+
+async def get_job(db: aiosqlite.Connection, job_id: str) -> dict | None:
+    row = await db.execute("SELECT * FROM analysis_jobs WHERE id = ?", (job_id,))
+    job = await row.fetchone()
+    if not job:
+        return None
+    result = dict(job)
+    result["job_id"] = result.pop("id")
+    return result
+
+
+analysis_jobs = AnalysisJobRunner(ANALYSIS_JOB_CONCURRENCY)
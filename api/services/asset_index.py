@@ -0,0 +1,93 @@
+import json
+import threading
+from pathlib import Path
+from typing import NamedTuple
+import aiosqlite
+from api.database import db_pool
+
+# SQLite's default bound-parameter limit is 999 on older builds
+_BATCH_SIZE = 500
+
+
+class IndexedAsset(NamedTuple):
+    path: str
+    mime_type: str
+    sha256: str | None
+
+
+class AssetIndex:
+    """In-memory map of asset ids to their stored file, filled from the assets table on demand.
+
+    Also remembers each stored file's downscaled renditions, keyed by path so
+    the compositor can look them up from the paths it is handed.
+    """
+
+    def __init__(self):
+        self._assets: dict[str, IndexedAsset] = {}
+        self._renditions: dict[str, list[dict]] = {}
+        self._lock = threading.Lock()
+
+    async def _load(self, db: aiosqlite.Connection, asset_ids: list[str]):
+        for start in range(0, len(asset_ids), _BATCH_SIZE):
+            batch = asset_ids[start:start + _BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = await db.execute(
+                f"SELECT id, path, mime_type, metadata, blob_sha256 FROM assets WHERE id IN ({placeholders})", batch
+            )
+            found = await rows.fetchall()
+            with self._lock:
+                for row in found:
+                    metadata = json.loads(row["metadata"])
+                    self._assets[row["id"]] = IndexedAsset(
+                        row["path"], row["mime_type"], row["blob_sha256"] or metadata.get("sha256")
+                    )
+                    self._renditions[row["path"]] = metadata.get("renditions", [])
+
+    async def resolve(self, db: aiosqlite.Connection, asset_ids) -> dict[str, Path]:
+        wanted = set(asset_ids)
+        with self._lock:
+            missing = [i for i in wanted if i not in self._assets]
+        if missing:
+            await self._load(db, missing)
+
+        with self._lock:
+            return {i: Path(self._assets[i].path) for i in wanted if i in self._assets}
+
+    async def lookup(self, asset_id: str) -> IndexedAsset | None:
+        """One asset's file, touching the database only on a miss."""
+        with self._lock:
+            asset = self._assets.get(asset_id)
+        if asset is None:
+            async with db_pool.read() as db:
+                await self._load(db, [asset_id])
+            with self._lock:
+                asset = self._assets.get(asset_id)
+        return asset
+
+    def register(self, asset_id: str, path: str, mime_type: str, sha256: str | None,
+                 renditions: list[dict] | None = None):
+        with self._lock:
+            self._assets[asset_id] = IndexedAsset(path, mime_type, sha256)
+            self._renditions[path] = renditions or []
+
+    def renditions(self, path: Path | str) -> list[dict]:
+        with self._lock:
+            return self._renditions.get(str(path), [])
+
+    def invalidate(self, asset_id: str):
+        with self._lock:
+            asset = self._assets.pop(asset_id, None)
+            if asset is not None and not any(a.path == asset.path for a in self._assets.values()):
+                self._renditions.pop(asset.path, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._assets), "files_with_renditions": sum(1 for r in self._renditions.values() if r)}
+
+
+asset_index = AssetIndex()
+
+
+def shard_path(base: Path, asset_id: str, ext: str) -> Path:
+    """Spread files over 256 subdirectories by the first two characters of the id."""
+    return base / asset_id[:2] / f"{asset_id}{ext}"
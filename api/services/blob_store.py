@@ -0,0 +1,69 @@
+import json
+import asyncio
+from pathlib import Path
+import aiosqlite
+from api.config import STORAGE_DIR
+from api.database import db_pool
+from api.services.asset_index import shard_path
+from api.services.media_probe import PROBE_FIELDS
+from api.services.uploads import StagedUpload, commit_upload, discard_upload
+
+BLOB_DIR = STORAGE_DIR / "blobs"
+
+
+def blob_path(sha256: str, ext: str) -> Path:
+    return shard_path(BLOB_DIR, sha256, ext.lower())
+
+
+async def blob_exists(sha256: str) -> bool:
+    async with db_pool.read() as db:
+        row = await db.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,))
+        return await row.fetchone() is not None
+
+
+async def store_blob(db: aiosqlite.Connection, staged: StagedUpload, ext: str) -> tuple[str, dict | None]:
+    """Take a reference on the blob for staged's content, storing it if it is new.
+
+    Returns the blob path and, for content already stored, the metadata and probed
+    media fields of an asset that uses it (the staged copy is discarded). Must run under the pool's
+    writer so two identical uploads can't both store the file; the caller commits.
+    """
+    row = await db.execute("SELECT path FROM blobs WHERE sha256 = ?", (staged.sha256,))
+    existing = await row.fetchone()
+    if existing:
+        await discard_upload(staged)
+        await db.execute("UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = ?", (staged.sha256,))
+        row = await db.execute(
+            f"SELECT metadata, {', '.join(PROBE_FIELDS)} FROM assets WHERE blob_sha256 = ? ORDER BY uploaded_at LIMIT 1",
+            (staged.sha256,),
+        )
+        asset = await row.fetchone()
+        if not asset:
+            return existing["path"], {"metadata": {}, "media": dict.fromkeys(PROBE_FIELDS)}
+        return existing["path"], {
+            "metadata": json.loads(asset["metadata"]),
+            "media": {field: asset[field] for field in PROBE_FIELDS},
+        }
+
+    path = blob_path(staged.sha256, ext)
+    await commit_upload(staged, path)
+    await db.execute(
+        "INSERT INTO blobs (sha256, path, size_bytes, ref_count) VALUES (?, ?, ?, 1)",
+        (staged.sha256, str(path), staged.size),
+    )
+    return str(path), None
+
+
+async def release_blob(db: aiosqlite.Connection, sha256: str) -> str | None:
+    """Drop one reference; returns the blob's path once nothing refers to it."""
+    await db.execute("UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = ?", (sha256,))
+    row = await db.execute("SELECT path, ref_count FROM blobs WHERE sha256 = ?", (sha256,))
+    blob = await row.fetchone()
+    if not blob or blob["ref_count"] > 0:
+        return None
+    await db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+    return blob["path"]
+
+
+async def delete_file(path: str):
+    await asyncio.to_thread(Path(path).unlink, missing_ok=True)
@@ -1,16 +1,50 @@
+import os
 import json
+import uuid
+import hashlib
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
-from api.config import STORAGE_DIR
+from PIL import ExifTags, Image, ImageColor, ImageDraw, ImageOps
+from api.config import ASSET_CACHE_MAX_BYTES, LAYER_CACHE_MAX_BYTES
+from api.metrics import compose_stage
+from api.services.asset_index import asset_index
+from api.services.cache import LRUCache, image_nbytes
+from api.services.encoding import encode_image
+from api.services.renditions import pick_rendition
+from api.services.text_layout import (
+    default_font_path, load_font, layout_text, wrap_lines, cache_stats as text_cache_stats,
+)
 
+# Holds decoded sources keyed ("source", path, mtime), draft-decoded previews
+# keyed ("draft", path, mtime, size) and cover-fit tiles keyed
+# ("tile", path, mtime, w, h, resample). Keyed by file rather than asset id so
+# assets deduplicated onto the same blob share entries.
+_asset_cache = LRUCache(ASSET_CACHE_MAX_BYTES)
 
-def compose_zones(zones: list[dict], canvas_width: int, canvas_height: int) -> Image.Image:
-    canvas = Image.new("RGB", (canvas_width, canvas_height), color=(26, 26, 26))
+# Rendered text layers and their offsets from the zone origin, keyed ("text",
+# content_hash, w, h, scale). Layers are position independent, so a moved or
+# re-ordered zone is re-blitted rather than re-rasterised.
+_layer_cache = LRUCache(LAYER_CACHE_MAX_BYTES, sizeof=lambda entry: image_nbytes(entry[0]))
 
-    for zone in sorted(zones, key=lambda z: z.get("zone_order", 0)):
+
+def compose_zones(zones: list[dict], canvas_width: int, canvas_height: int, on_zone=None,
+                  scale: float = 1.0, preview: bool = False,
+                  asset_paths: dict[str, Path] | None = None) -> Image.Image:
+    """Render zones in zone_order onto a fresh canvas.
+
+    asset_paths maps image asset ids to files (see asset_index.resolve); zones whose
+    asset is missing from it are left blank.
+    on_zone(done, total) is called after each zone; raising from it aborts the render.
+    scale shrinks the canvas and every zone; preview trades quality for speed with
+    draft JPEG decoding and bilinear resampling.
+    """
+    asset_paths = asset_paths or {}
+    canvas = Image.new("RGB", _scaled_size(canvas_width, canvas_height, scale), color=(26, 26, 26))
+
+    ordered = sorted(zones, key=lambda z: z.get("zone_order", 0))
+    for index, zone in enumerate(ordered):
         bounds = zone["bounds"]
-        x, y = int(bounds["x"]), int(bounds["y"])
-        w, h = int(bounds["width"]), int(bounds["height"])
+        x, y = int(bounds["x"] * scale), int(bounds["y"] * scale)
+        w, h = _scaled_size(int(bounds["width"]), int(bounds["height"]), scale)
         content = zone["content"]
         if isinstance(content, str):
             content = json.loads(content)
@@ -18,23 +52,80 @@ def compose_zones(zones: list[dict], canvas_width: int, canvas_height: int) -> I
         content_type = content.get("type", "empty")
 
         if content_type == "image" and content.get("asset_id"):
-            _compose_image(canvas, content, x, y, w, h)
+            _compose_image(canvas, content, asset_paths.get(content["asset_id"]), x, y, w, h, preview)
         elif content_type == "text" and content.get("text"):
-            _compose_text(canvas, content, x, y, w, h)
+            _compose_text(canvas, content, x, y, w, h, scale)
         elif content_type == "solid":
             _compose_solid(canvas, content, x, y, w, h)
 
+        if on_zone:
+            on_zone(index + 1, len(ordered))
+
     return canvas
 
 
-def _compose_image(canvas: Image.Image, content: dict, x: int, y: int, w: int, h: int):
-    asset_id = content["asset_id"]
-    asset_dir = STORAGE_DIR / "image"
-    matching = list(asset_dir.glob(f"{asset_id}.*")) if asset_dir.exists() else []
-    if not matching:
+def _scaled_size(w: int, h: int, scale: float) -> tuple[int, int]:
+    if scale == 1.0:
+        return w, h
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def render_to_file(zones: list[dict], canvas_width: int, canvas_height: int, output_path: Path,
+                   on_zone=None, scale: float = 1.0, preview: bool = False,
+                   asset_paths: dict[str, Path] | None = None, output: dict | None = None) -> dict:
+    """Compose and encode to output_path; returns the encoder report.
+
+    output holds encode_image options plus "format" (png, webp or jpeg); a
+    compress_level of None picks the level for the render mode.
+    """
+    canvas = compose_zones(zones, canvas_width, canvas_height, on_zone, scale, preview, asset_paths)
+    options = dict(output or {})
+    fmt = options.pop("format", "png")
+    if options.get("compress_level") is None:
+        # Left to us: previews trade PNG size for encode speed
+        options["compress_level"] = 1 if preview else 6
+    with compose_stage.time(zone_type="canvas", stage="encode"):
+        data, report = encode_image(canvas, fmt, **options)
+    # Write then rename so concurrent identical renders never expose a partial file
+    with compose_stage.time(zone_type="canvas", stage="write"):
+        tmp_path = output_path.with_name(f"{output_path.stem}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, output_path)
+    return report
+
+
+def _compose_image(canvas: Image.Image, content: dict, path: Path | None, x: int, y: int, w: int, h: int,
+                   preview: bool = False):
+    if path is None or not path.exists():
         return
 
-    img = Image.open(matching[0]).convert("RGB")
+    # Decode the smallest stored rendition that still covers the zone
+    rendition = pick_rendition(asset_index.renditions(path), w, h)
+    if rendition is not None and Path(rendition["path"]).exists():
+        path = Path(rendition["path"])
+
+    tile = _load_cover_tile(path, w, h, preview)
+    with compose_stage.time(zone_type="image", stage="paste"):
+        canvas.paste(tile, (x, y))
+
+
+def _load_cover_tile(path: Path, w: int, h: int, preview: bool = False) -> Image.Image:
+    mtime = path.stat().st_mtime_ns
+    resample = Image.BILINEAR if preview else Image.LANCZOS
+    tile_key = ("tile", str(path), mtime, w, h, resample)
+    tile = _asset_cache.get(tile_key)
+    if tile is not None:
+        return tile
+
+    source_key = ("source", str(path), mtime)
+    img = _asset_cache.get(source_key)
+    if img is None and preview:
+        img = _load_draft_source(path, mtime, w, h)
+    elif img is None:
+        with compose_stage.time(zone_type="image", stage="decode"), Image.open(path) as f:
+            img = _decode_upright(f)
+        _asset_cache.put(source_key, img)
+
     img_ratio = img.width / img.height
     zone_ratio = w / h
 
@@ -45,82 +136,132 @@ def _compose_image(canvas: Image.Image, content: dict, x: int, y: int, w: int, h
         new_w = w
         new_h = int(w / img_ratio)
 
-    img = img.resize((new_w, new_h), Image.LANCZOS)
-    left = (new_w - w) // 2
-    top = (new_h - h) // 2
-    img = img.crop((left, top, left + w, top + h))
-    canvas.paste(img, (x, y))
+    with compose_stage.time(zone_type="image", stage="resize"):
+        resized = img.resize((new_w, new_h), resample)
+        left = (new_w - w) // 2
+        top = (new_h - h) // 2
+        tile = resized.crop((left, top, left + w, top + h))
+    _asset_cache.put(tile_key, tile)
+    return tile
+
+
+def _decode_upright(f: Image.Image) -> Image.Image:
+    img = f.convert("RGB")
+    ImageOps.exif_transpose(img, in_place=True)
+    return img
+
 
+def _load_draft_source(path: Path, mtime: int, w: int, h: int) -> Image.Image:
+    """Decode at the smallest JPEG DCT scale that still covers a w x h zone.
 
-def _compose_text(canvas: Image.Image, content: dict, x: int, y: int, w: int, h: int):
-    draw = ImageDraw.Draw(canvas)
+    draft() only reduces JPEGs. Anything it can't shrink is decoded in full and
+    cached as the shared ("source", ...) entry, not once more per zone size.
+    """
+    with Image.open(path) as f:
+        upright_w, upright_h = f.size
+        if f.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+            # Quarter-turned; it's the upright image that has to cover the zone
+            upright_w, upright_h = f.height, f.width
+        ratio = max(w / upright_w, h / upright_h)
+        target = (max(1, int(f.width * ratio)), max(1, int(f.height * ratio)))
+        key = ("draft", str(path), mtime, target)
+        img = _asset_cache.get(key)
+        if img is None:
+            full_size = f.size
+            with compose_stage.time(zone_type="image", stage="decode"):
+                f.draft("RGB", target)
+                if f.size == full_size:
+                    key = ("source", str(path), mtime)
+                img = _decode_upright(f)
+            _asset_cache.put(key, img)
+    return img
+
+
+def cache_stats() -> dict:
+    return {"assets": _asset_cache.stats(), "layers": _layer_cache.stats(), **text_cache_stats()}
+
+
+def _compose_text(canvas: Image.Image, content: dict, x: int, y: int, w: int, h: int,
+                  scale: float = 1.0):
+    key = ("text", _content_hash(content), w, h, scale)
+    entry = _layer_cache.get(key)
+    if entry is None:
+        entry = _render_text_layer(content, w, h, scale)
+        _layer_cache.put(key, entry)
+    layer, (dx, dy) = entry
+    with compose_stage.time(zone_type="text", stage="paste"):
+        canvas.paste(layer, (x + dx, y + dy), layer)
+
+
+def _content_hash(content: dict) -> str:
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _render_text_layer(content: dict, w: int, h: int,
+                       scale: float = 1.0) -> tuple[Image.Image, tuple[int, int]]:
+    """Rasterise a text zone onto a transparent layer covering the text's ink.
+
+    Returns the layer and its offset from the zone origin. The layer is sized to the
+    text block rather than the zone, so text that overflows its zone spills past it
+    as it does when drawn straight onto the canvas.
+    """
     text = content.get("text", "")
-    size = content.get("size", 24)
-    colour = content.get("colour", "#e8e8e8")
+    size = max(1, round(content.get("size", 24) * scale))
+    # Drawn opaque, as on the RGB canvas: any alpha in the colour is ignored
+    colour = ImageColor.getcolor(content.get("colour", "#e8e8e8"), "RGB")
     alignment = content.get("alignment", "center")
-    padding = 10
+    padding = max(1, round(10 * scale))
 
-    try:
-        font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", size)
-    except OSError:
-        try:
-            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", size)
-        except OSError:
-            font = ImageFont.load_default()
+    font_path = default_font_path()
+    font = load_font(font_path, size)
 
     max_width = w - padding * 2
-    lines = _wrap_text(draw, text, font, max_width)
-
-    # Measure each line and total block height
-    line_metrics = []
-    for line in lines:
-        bbox = draw.textbbox((0, 0), line, font=font)
-        line_w = bbox[2] - bbox[0]
-        line_h = bbox[3] - bbox[1]
-        line_metrics.append((line, line_w, line_h))
+    with compose_stage.time(zone_type="text", stage="layout"):
+        line_metrics = layout_text(text, font_path, size, max_width)
 
     total_height = sum(m[2] for m in line_metrics)
     line_spacing = max(int(size * 0.25), 2)
     total_height += line_spacing * (len(line_metrics) - 1) if len(line_metrics) > 1 else 0
 
     # Center the text block vertically in the zone
-    ty = y + (h - total_height) // 2
+    ty = (h - total_height) // 2
 
+    placed = []
     for line, line_w, line_h in line_metrics:
         if alignment == "center":
-            tx = x + (w - line_w) // 2
+            tx = (w - line_w) // 2
         elif alignment == "right":
-            tx = x + w - line_w - padding
+            tx = w - line_w - padding
         else:
-            tx = x + padding
-
-        draw.text((tx, ty), line, fill=colour, font=font)
+            tx = padding
+        placed.append((tx, ty, line))
         ty += line_h + line_spacing
 
+    boxes = [(tx + l, ty + t, tx + r, ty + b)
+             for tx, ty, line in placed
+             for l, t, r, b in [font.getbbox(line)] if r > l and b > t]
+    if not boxes:
+        return Image.new("RGBA", (1, 1), (0, 0, 0, 0)), (0, 0)
+    left, top = min(b[0] for b in boxes), min(b[1] for b in boxes)
+    right, bottom = max(b[2] for b in boxes), max(b[3] for b in boxes)
+
+    layer = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    with compose_stage.time(zone_type="text", stage="draw"):
+        for tx, ty, line in placed:
+            draw.text((tx - left, ty - top), line, fill=colour, font=font)
+
+    return layer, (left, top)
+
 
 def _wrap_text(draw: ImageDraw.ImageDraw, text: str, font, max_width: int) -> list[str]:
     """Break text into lines that fit within max_width using word wrapping."""
-    words = text.split()
-    if not words:
-        return [""]
-
-    lines: list[str] = []
-    current_line = words[0]
-
-    for word in words[1:]:
-        test_line = current_line + " " + word
-        bbox = draw.textbbox((0, 0), test_line, font=font)
-        if (bbox[2] - bbox[0]) <= max_width:
-            current_line = test_line
-        else:
-            lines.append(current_line)
-            current_line = word
-
-    lines.append(current_line)
-    return lines
+    return wrap_lines(font, text, max_width)
 
 
 def _compose_solid(canvas: Image.Image, content: dict, x: int, y: int, w: int, h: int):
-    draw = ImageDraw.Draw(canvas)
-    colour = content.get("colour", "#1a1a1a")
-    draw.rectangle([x, y, x + w, y + h], fill=colour)
+    with compose_stage.time(zone_type="solid", stage="fill"):
+        draw = ImageDraw.Draw(canvas)
+        colour = content.get("colour", "#1a1a1a")
+        draw.rectangle([x, y, x + w, y + h], fill=colour)
@@ -0,0 +1,66 @@
+import io
+import time
+from PIL import Image
+
+# format -> (Pillow format, media type, file extension)
+FORMATS = {
+    "png": ("PNG", "image/png", ".png"),
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+}
+
+EXTENSION_MEDIA_TYPES = {ext: media for _, media, ext in FORMATS.values()}
+
+MIN_QUALITY = 5
+MAX_QUALITY = 95
+
+
+def _encode(img: Image.Image, fmt: str, quality: int, lossless: bool, compress_level: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "png":
+        img.save(buf, "PNG", compress_level=compress_level)
+    elif fmt == "webp":
+        img.save(buf, "WEBP", quality=quality, lossless=lossless, method=4)
+    else:
+        img.save(buf, "JPEG", quality=quality, progressive=True, optimize=True)
+    return buf.getvalue()
+
+
+def encode_image(img: Image.Image, fmt: str = "png", quality: int = 90, lossless: bool = False,
+                 compress_level: int = 6, target_bytes: int | None = None) -> tuple[bytes, dict]:
+    """Encode img, binary-searching lossy quality toward target_bytes when given.
+
+    Returns the encoded bytes and a report with the chosen quality, attempt count
+    and encode time.
+    """
+    start = time.perf_counter()
+    attempts = 1
+
+    if target_bytes is None or fmt == "png" or lossless:
+        data = _encode(img, fmt, quality, lossless, compress_level)
+    else:
+        # Highest quality whose output fits; fall back to the smallest we can make
+        lo, hi = MIN_QUALITY, max(MIN_QUALITY, min(quality, MAX_QUALITY))
+        data, smallest = None, None
+        attempts = 0
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            candidate = _encode(img, fmt, mid, False, compress_level)
+            attempts += 1
+            if len(candidate) <= target_bytes:
+                data, quality = candidate, mid
+                lo = mid + 1
+            else:
+                hi = mid - 1
+                if smallest is None or len(candidate) < len(smallest[0]):
+                    smallest = (candidate, mid)
+        if data is None:
+            data, quality = smallest
+
+    return data, {
+        "format": fmt,
+        "quality": None if fmt == "png" or lossless else quality,
+        "encode_attempts": attempts,
+        "encode_ms": round((time.perf_counter() - start) * 1000, 2),
+        "bytes": len(data),
+    }
@@ -0,0 +1,197 @@
+import struct
+from typing import BinaryIO
+from PIL import Image
+
+# Upper bounds on what a probe will read, however the container is laid out
+MAX_BOXES = 4096
+EBML_READ_LIMIT = 256 * 1024
+
+EXIF_ORIENTATION = 0x0112
+
+PROBE_FIELDS = ("width", "height", "orientation", "colour_mode", "duration_ms")
+
+
+def probe_media(path: str, mime_type: str) -> dict:
+    """Dimensions, orientation, colour mode and duration from container headers only.
+
+    Never decodes pixels or samples; fields a format doesn't carry are None.
+    Blocking, so call it from a worker thread.
+    """
+    result = dict.fromkeys(PROBE_FIELDS)
+    try:
+        with open(path, "rb") as f:
+            if mime_type.startswith("image/"):
+                result.update(_probe_image(f))
+            elif mime_type in ("video/mp4", "video/quicktime", "audio/mp4", "audio/aac"):
+                result.update(_probe_isobmff(f))
+            elif mime_type == "video/webm":
+                result.update(_probe_webm(f))
+            elif mime_type == "audio/wav":
+                result.update(_probe_wav(f))
+    except (OSError, struct.error, ValueError, IndexError, SyntaxError):
+        pass
+    return result
+
+
+def _probe_image(f: BinaryIO) -> dict:
+    # Image.open only parses the header; pixel data is left until load()
+    with Image.open(f) as img:
+        orientation = None
+        # info["exif"] is filled from the header for JPEG and WebP; getexif() on
+        # PNG would decode the whole image looking for a trailing eXIf chunk
+        if img.info.get("exif"):
+            exif = Image.Exif()
+            exif.load(img.info["exif"])
+            orientation = exif.get(EXIF_ORIENTATION)
+        return {"width": img.width, "height": img.height, "orientation": orientation, "colour_mode": img.mode}
+
+
+def _read(f: BinaryIO, n: int) -> bytes:
+    data = f.read(n)
+    if len(data) < n:
+        raise ValueError("truncated box")
+    return data
+
+
+def _iter_boxes(f: BinaryIO, start: int, end: int):
+    """(type, payload offset, payload end) for each ISO BMFF box in [start, end)."""
+    offset = start
+    for _ in range(MAX_BOXES):
+        if end - offset < 8:
+            return
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = offset + 8
+        if size == 1:
+            size = struct.unpack(">Q", _read(f, 8))[0]
+            payload += 8
+        elif size == 0:
+            size = end - offset
+        if size < payload - offset:
+            return
+        yield box_type, payload, min(offset + size, end)
+        offset += size
+
+
+def _probe_isobmff(f: BinaryIO) -> dict:
+    """Duration from moov/mvhd and picture size from the first video track's tkhd.
+
+    Only box headers and those two small boxes are read, so a moov placed after
+    the media data costs a few seeks rather than a scan.
+    """
+    f.seek(0, 2)
+    file_end = f.tell()
+    result = {}
+    for box_type, start, end in _iter_boxes(f, 0, file_end):
+        if box_type != b"moov":
+            continue
+        for child, child_start, child_end in _iter_boxes(f, start, end):
+            if child == b"mvhd":
+                f.seek(child_start)
+                version = _read(f, 1)[0]
+                if version == 1:
+                    f.seek(child_start + 4 + 16)
+                    timescale, duration = struct.unpack(">IQ", _read(f, 12))
+                else:
+                    f.seek(child_start + 4 + 8)
+                    timescale, duration = struct.unpack(">II", _read(f, 8))
+                if timescale:
+                    result["duration_ms"] = round(duration * 1000 / timescale)
+            elif child == b"trak" and "width" not in result:
+                for grandchild, gc_start, gc_end in _iter_boxes(f, child_start, child_end):
+                    if grandchild == b"tkhd":
+                        # Width and height are the last 8 bytes, as 16.16 fixed point
+                        f.seek(gc_end - 8)
+                        width, height = struct.unpack(">II", _read(f, 8))
+                        if width and height:
+                            result["width"], result["height"] = width >> 16, height >> 16
+                        break
+        break
+    return result
+
+
+_EBML_SEGMENT = 0x18538067
+_EBML_INFO = 0x1549A966
+_EBML_TIMECODE_SCALE = 0x2AD7B1
+_EBML_DURATION = 0x4489
+_EBML_TRACKS = 0x1654AE6B
+_EBML_TRACK_ENTRY = 0xAE
+_EBML_VIDEO = 0xE0
+_EBML_PIXEL_WIDTH = 0xB0
+_EBML_PIXEL_HEIGHT = 0xBA
+_EBML_CONTAINERS = {_EBML_SEGMENT, _EBML_INFO, _EBML_TRACKS, _EBML_TRACK_ENTRY, _EBML_VIDEO}
+
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool) -> tuple[int, int, bool]:
+    first = data[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise ValueError("bad EBML varint")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, pos + length, unknown
+
+
+def _probe_webm(f: BinaryIO) -> dict:
+    """Duration and picture size from the Segment Info and Tracks in the first EBML_READ_LIMIT bytes."""
+    data = f.read(EBML_READ_LIMIT)
+    found = {}
+
+    def walk(pos: int, end: int):
+        while pos < end and pos < len(data):
+            element, pos, _ = _read_vint(data, pos, keep_marker=True)
+            size, pos, unknown = _read_vint(data, pos, keep_marker=False)
+            stop = len(data) if unknown else min(pos + size, len(data))
+            if element in _EBML_CONTAINERS:
+                walk(pos, stop)
+            elif element == _EBML_TIMECODE_SCALE:
+                found["scale"] = int.from_bytes(data[pos:stop], "big")
+            elif element == _EBML_DURATION:
+                found["duration"] = struct.unpack(">f" if size == 4 else ">d", data[pos:stop])[0]
+            elif element == _EBML_PIXEL_WIDTH and "width" not in found:
+                found["width"] = int.from_bytes(data[pos:stop], "big")
+            elif element == _EBML_PIXEL_HEIGHT and "height" not in found:
+                found["height"] = int.from_bytes(data[pos:stop], "big")
+            pos = stop
+
+    try:
+        walk(0, len(data))
+    except (ValueError, IndexError, struct.error):
+        # Truncated by the read limit; keep whatever was found before the cut
+        pass
+
+    result = {k: found[k] for k in ("width", "height") if k in found}
+    if "duration" in found:
+        # Duration is in TimecodeScale units, which default to 1ms (in ns)
+        result["duration_ms"] = round(found["duration"] * found.get("scale", 1_000_000) / 1_000_000)
+    return result
+
+
+def _probe_wav(f: BinaryIO) -> dict:
+    """Duration from the fmt chunk's byte rate and the data chunk's size."""
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        return {}
+    byte_rate = None
+    for _ in range(MAX_BOXES):
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        chunk_id, size = struct.unpack("<4sI", header)
+        if chunk_id == b"fmt ":
+            fmt = f.read(size + size % 2)
+            byte_rate = struct.unpack("<I", fmt[8:12])[0]
+        elif chunk_id == b"data":
+            if byte_rate:
+                return {"duration_ms": round(size * 1000 / byte_rate)}
+            break
+        else:
+            f.seek(size + size % 2, 1)
+    return {}
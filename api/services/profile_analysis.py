@@ -0,0 +1,291 @@
+import json
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+import aiosqlite
+import anthropic
+from api.config import COLOUR_WORKERS, VISION_CONCURRENCY, VISION_TIMEOUT, VISION_MAX_RETRIES
+from api.database import db_pool
+from api.services import analysis_cache
+from api.services.style_extraction import (
+    PreparedImage, prepare_image, extract_colours, analyze_with_vision_async,
+    empty_profile_stats, accumulate_profile_stats, profile_from_stats,
+)
+
+_colour_pool = ThreadPoolExecutor(max_workers=COLOUR_WORKERS, thread_name_prefix="colours")
+# One limit for the whole process, shared by sync analyses, background jobs and add-image
+_vision_limit = asyncio.Semaphore(VISION_CONCURRENCY)
+
+_RETRYABLE = (
+    anthropic.RateLimitError,
+    anthropic.APIConnectionError,
+    anthropic.InternalServerError,
+    TimeoutError,
+)
+
+EMPTY_COLOURS = {"primary": [], "accent": [], "background": [], "text": []}
+
+
+async def _vision_with_retry(image: PreparedImage) -> dict:
+    async with _vision_limit:
+        for attempt in range(VISION_MAX_RETRIES + 1):
+            try:
+                return await asyncio.wait_for(analyze_with_vision_async(image), VISION_TIMEOUT)
+            except _RETRYABLE:
+                if attempt == VISION_MAX_RETRIES:
+                    raise
+                # Exponential backoff with jitter so throttled requests don't retry in lockstep
+                await asyncio.sleep(min(2 ** attempt, 30) * random.uniform(0.5, 1.0))
+
+
+async def _cached(image_hash: str | None, kind: str, compute) -> dict:
+    if image_hash:
+        async with db_pool.write() as db:
+            hit = await analysis_cache.get(db, image_hash, kind)
+        if hit is not None:
+            return hit
+    value = await compute()
+    if image_hash and "error" not in value:
+        async with db_pool.write() as db:
+            await analysis_cache.put(db, image_hash, kind, value)
+    return value
+
+
+async def analyze_images(image_paths: list[str], cache: bool = False,
+                         on_result=None) -> tuple[list[dict], list[dict]]:
+    """Colour-cluster and vision-analyse every image concurrently.
+
+    Each image is decoded once (prepare_image); colour extraction runs on a thread
+    pool from the decoded thumbnail and vision calls send the downsized JPEG under the
+    process-wide VISION_CONCURRENCY limit.
+    With cache, results are looked up in and saved to the analysis cache by image hash;
+    the pool's writer is only taken for each lookup and store, never across a call.
+    Results keep input order. on_result(index, colours, vision) is awaited as each
+    image finishes, in completion order.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def analyze_one(index: int, image_path: str):
+        image_hash = None
+        if cache:
+            try:
+                image_hash = await asyncio.to_thread(analysis_cache.file_sha256, image_path)
+            except OSError:
+                pass
+
+        # Decoded lazily and at most once, so fully cached images are never opened
+        prepared = None
+
+        def prepare():
+            nonlocal prepared
+            if prepared is None:
+                prepared = loop.run_in_executor(_colour_pool, prepare_image, image_path)
+            return prepared
+
+        async def colours_from_image():
+            image = await prepare()
+            return await loop.run_in_executor(_colour_pool, extract_colours, image.thumbnail)
+
+        async def vision_from_image():
+            return await _vision_with_retry(await prepare())
+
+        colours, vision = await asyncio.gather(
+            _cached(image_hash, "colours", colours_from_image),
+            _cached(image_hash, "vision", vision_from_image),
+            return_exceptions=True,
+        )
+        if isinstance(colours, Exception):
+            colours = {**EMPTY_COLOURS, "error": str(colours)}
+        if isinstance(vision, Exception):
+            vision = {"error": str(vision) or type(vision).__name__}
+        return index, colours, vision
+
+    colour_results: list[dict] = [{}] * len(image_paths)
+    vision_results: list[dict] = [{}] * len(image_paths)
+    for next_done in asyncio.as_completed([analyze_one(i, p) for i, p in enumerate(image_paths)]):
+        index, colours, vision = await next_done
+        colour_results[index] = colours
+        vision_results[index] = vision
+        if on_result:
+            await on_result(index, colours, vision)
+
+    if cache:
+        async with db_pool.write() as db:
+            await analysis_cache.evict(db)
+    return colour_results, vision_results
+
+
+async def save_analysis(db: aiosqlite.Connection, profile_id: str, image_paths: list[str],
+                        colour_results: list[dict], vision_results: list[dict]) -> dict | None:
+    """Rebuild a profile from per-image results; None if every analysis failed.
+
+    Per-image results and the aggregate statistics are stored so later image
+    additions and removals can be merged without re-reading the other images.
+    """
+    stats = empty_profile_stats()
+    for colours, vision in zip(colour_results, vision_results):
+        accumulate_profile_stats(stats, colours, vision)
+    if stats["colour_images"] <= 0 and stats["vision_images"] <= 0:
+        return None
+
+    profile = profile_from_stats(stats)
+    await db.execute("DELETE FROM profile_images WHERE profile_id = ?", (profile_id,))
+    await db.executemany(
+        "INSERT OR REPLACE INTO profile_images (profile_id, image_path, colours, vision) VALUES (?, ?, ?, ?)",
+        [(profile_id, path, json.dumps(c), json.dumps(v))
+         for path, c, v in zip(image_paths, colour_results, vision_results)],
+    )
+    await db.execute(
+        """UPDATE style_profiles SET
+           colours = ?, typography = ?, composition = ?, textures = ?, mood = ?,
+           stats = ?, source_images = ?, version = version + 1, updated_at = datetime('now')
+           WHERE id = ?""",
+        (*_profile_columns(profile), json.dumps(stats), json.dumps(image_paths), profile_id),
+    )
+    await db.commit()
+    return profile
+
+
+def _profile_columns(profile: dict) -> tuple[str, ...]:
+    return tuple(json.dumps(profile[f]) for f in ("colours", "typography", "composition", "textures", "mood"))
+
+
+class ProfileConflict(Exception):
+    pass
+
+
+async def _update_stats(db: aiosqlite.Connection, profile_id: str, mutate) -> dict:
+    """Apply mutate(stats, source_images) and re-derive the profile from the new stats.
+
+    The row is read inside an IMMEDIATE transaction, so SQLite's write lock is
+    already held and writers in other processes wait (busy_timeout) rather than
+    change it under the merge. The version guard stays as a backstop. Leaves the
+    transaction open for the caller.
+    """
+    for _ in range(5):
+        if not db.in_transaction:
+            await db.execute("BEGIN IMMEDIATE")
+        row = await db.execute(
+            "SELECT stats, source_images, version FROM style_profiles WHERE id = ?", (profile_id,)
+        )
+        current = await row.fetchone()
+        stats = json.loads(current["stats"]) or empty_profile_stats()
+        source_images = json.loads(current["source_images"])
+        mutate(stats, source_images)
+
+        profile = profile_from_stats(stats)
+        cursor = await db.execute(
+            """UPDATE style_profiles SET
+               colours = ?, typography = ?, composition = ?, textures = ?, mood = ?,
+               stats = ?, source_images = ?, version = version + 1, updated_at = datetime('now')
+               WHERE id = ? AND version = ?""",
+            (*_profile_columns(profile), json.dumps(stats), json.dumps(source_images),
+             profile_id, current["version"]),
+        )
+        if cursor.rowcount == 1:
+            return profile
+        await db.rollback()
+    raise ProfileConflict()
+
+
+async def _needs_rebuild(profile_id: str) -> list[str] | None:
+    # Profiles analysed before stats were stored have nothing to merge into
+    async with db_pool.read() as db:
+        row = await db.execute("SELECT stats, source_images FROM style_profiles WHERE id = ?", (profile_id,))
+        profile = await row.fetchone()
+    source_images = json.loads(profile["source_images"])
+    if json.loads(profile["stats"]) or not source_images:
+        return None
+    return source_images
+
+
+async def _rebuild(profile_id: str, image_paths: list[str]) -> dict | None:
+    colour_results, vision_results = await analyze_images(image_paths, cache=True)
+    async with db_pool.write() as db:
+        return await save_analysis(db, profile_id, image_paths, colour_results, vision_results)
+
+
+async def add_image(profile_id: str, image_path: str) -> dict | None:
+    """Analyse one image and merge it into the profile; None if its analysis failed."""
+    async with db_pool.read() as db:
+        row = await db.execute("SELECT stats, source_images FROM style_profiles WHERE id = ?", (profile_id,))
+        current = await row.fetchone()
+    if image_path in json.loads(current["source_images"]) and json.loads(current["stats"]):
+        return profile_from_stats(json.loads(current["stats"]))
+
+    legacy = await _needs_rebuild(profile_id)
+    if legacy is not None:
+        return await _rebuild(profile_id, legacy if image_path in legacy else legacy + [image_path])
+
+    colour_results, vision_results = await analyze_images([image_path], cache=True)
+    colours, vision = colour_results[0], vision_results[0]
+    if "error" in colours and "error" in vision:
+        return None
+
+    def merge(stats: dict, source_images: list[str]):
+        if image_path in source_images:
+            return
+        accumulate_profile_stats(stats, colours, vision)
+        source_images.append(image_path)
+
+    async with db_pool.write() as db:
+        profile = await _update_stats(db, profile_id, merge)
+        await db.execute(
+            "INSERT OR REPLACE INTO profile_images (profile_id, image_path, colours, vision) VALUES (?, ?, ?, ?)",
+            (profile_id, image_path, json.dumps(colours), json.dumps(vision)),
+        )
+        await db.commit()
+    return profile
+
+
+async def remove_image(profile_id: str, image_path: str) -> dict | None:
+    """Subtract one image's stored results from the profile; None if it isn't part of it."""
+    legacy = await _needs_rebuild(profile_id)
+    if legacy is not None:
+        if image_path not in legacy:
+            return None
+        remaining = [p for p in legacy if p != image_path]
+        if remaining:
+            return await _rebuild(profile_id, remaining)
+        stats = empty_profile_stats()
+        profile = profile_from_stats(stats)
+        async with db_pool.write() as db:
+            await db.execute(
+                """UPDATE style_profiles SET
+                   colours = ?, typography = ?, composition = ?, textures = ?, mood = ?,
+                   stats = ?, source_images = '[]', version = version + 1, updated_at = datetime('now')
+                   WHERE id = ?""",
+                (*_profile_columns(profile), json.dumps(stats), profile_id),
+            )
+            await db.commit()
+        return profile
+
+    async with db_pool.read() as db:
+        row = await db.execute(
+            "SELECT colours, vision FROM profile_images WHERE profile_id = ? AND image_path = ?",
+            (profile_id, image_path),
+        )
+        image = await row.fetchone()
+    if not image:
+        return None
+    colours, vision = json.loads(image["colours"]), json.loads(image["vision"])
+
+    removed = False
+
+    def unmerge(stats: dict, source_images: list[str]):
+        nonlocal removed
+        # A concurrent removal of the same image may already have subtracted it
+        removed = image_path in source_images
+        if not removed:
+            return
+        accumulate_profile_stats(stats, colours, vision, sign=-1)
+        source_images.remove(image_path)
+
+    async with db_pool.write() as db:
+        profile = await _update_stats(db, profile_id, unmerge)
+        if removed:
+            await db.execute(
+                "DELETE FROM profile_images WHERE profile_id = ? AND image_path = ?", (profile_id, image_path)
+            )
+        await db.commit()
+    return profile if removed else None
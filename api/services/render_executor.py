@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from api.config import RENDER_WORKERS, RENDER_QUEUE_SIZE
+
+
+class ExecutorSaturated(Exception):
+    pass
+
+
+class RenderExecutor:
+    """Runs blocking render work on a thread pool with a bounded backlog.
+
+    Threads rather than processes: Pillow releases the GIL for resampling,
+    drawing and encoding, and workers share the in-process asset cache.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wall_ms: deque[float] = deque(maxlen=200)
+
+    async def run(self, fn, *args, **kwargs) -> tuple[object, dict]:
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise ExecutorSaturated()
+            self._pending += 1
+
+        submitted = time.perf_counter()
+        started = finished = submitted
+
+        def task():
+            nonlocal started, finished
+            started = time.perf_counter()
+            with self._lock:
+                self._running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._running -= 1
+
+        def settle(future):
+            # Runs when the work itself ends, so a cancelled caller can't release
+            # its slot while a worker is still rendering
+            with self._lock:
+                self._pending -= 1
+                if future.cancelled():
+                    return
+                if future.exception() is not None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                    self._wall_ms.append(round((finished - started) * 1000, 2))
+
+        future = self._pool.submit(task)
+        future.add_done_callback(settle)
+        result = await asyncio.wrap_future(future)
+
+        timing = {
+            "queue_ms": round((started - submitted) * 1000, 2),
+            "render_ms": round((finished - started) * 1000, 2),
+        }
+        return result, timing
+
+    def stats(self) -> dict:
+        with self._lock:
+            wall = sorted(self._wall_ms)
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "render_ms_p50": wall[len(wall) // 2] if wall else None,
+                "render_ms_max": wall[-1] if wall else None,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+render_executor = RenderExecutor(RENDER_WORKERS, RENDER_QUEUE_SIZE)
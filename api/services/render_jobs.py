@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+import uuid
+from pathlib import Path
+from api.config import RENDER_JOBS_PER_PROJECT
+from api.services.compositor import render_to_file
+from api.services.render_executor import render_executor, ExecutorSaturated
+
+TERMINAL_STATUSES = {"completed", "failed", "cancelled"}
+MAX_FINISHED_JOBS = 500
+
+
+class JobLimitReached(Exception):
+    pass
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+class RenderJob:
+    def __init__(self, project_id: str, render_id: str, total_zones: int):
+        self.id = str(uuid.uuid4())
+        self.project_id = project_id
+        self.render_id = render_id
+        self.status = "queued"
+        self.total_zones = total_zones
+        self.completed_zones = 0
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.timing: dict = {}
+        self.cancel_event = threading.Event()
+        self.events: list[dict] = []
+        self._subscribers: list[asyncio.Queue] = []
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "render_id": self.render_id if self.status == "completed" else None,
+            "completed_zones": self.completed_zones,
+            "total_zones": self.total_zones,
+            "error": self.error,
+            **self.timing,
+        }
+
+    def publish(self, event: str, **data):
+        payload = {"event": event, **self.to_dict(), **data}
+        self.events.append(payload)
+        for queue in self._subscribers:
+            queue.put_nowait(payload)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        for payload in self.events:
+            queue.put_nowait(payload)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+
+class RenderJobManager:
+    """In-memory registry of asynchronous render jobs, capped per project."""
+
+    def __init__(self, per_project_limit: int):
+        self.per_project_limit = per_project_limit
+        self._jobs: dict[str, RenderJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def get(self, job_id: str) -> RenderJob | None:
+        return self._jobs.get(job_id)
+
+    def active_for_project(self, project_id: str) -> int:
+        return sum(
+            1 for job in self._jobs.values()
+            if job.project_id == project_id and job.status not in TERMINAL_STATUSES
+        )
+
+    def submit(self, project_id: str, render_id: str, zones: list[dict], canvas_width: int,
+               canvas_height: int, output_path: Path, asset_paths: dict[str, Path],
+               output: dict | None = None) -> RenderJob:
+        if self.active_for_project(project_id) >= self.per_project_limit:
+            raise JobLimitReached()
+
+        job = RenderJob(project_id, render_id, len(zones))
+        self._jobs[job.id] = job
+        job.publish("queued")
+        task = asyncio.create_task(
+            self._run(job, zones, canvas_width, canvas_height, output_path, asset_paths, output)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._prune()
+        return job
+
+    def cancel(self, job: RenderJob):
+        if job.status in TERMINAL_STATUSES:
+            return
+        job.cancel_event.set()
+
+    async def _run(self, job: RenderJob, zones: list[dict], canvas_width: int, canvas_height: int,
+                   output_path: Path, asset_paths: dict[str, Path], output: dict | None):
+        loop = asyncio.get_running_loop()
+
+        def on_zone(done: int, total: int):
+            if job.cancel_event.is_set():
+                raise RenderCancelled()
+            loop.call_soon_threadsafe(self._zone_done, job, done)
+
+        try:
+            if output_path.exists():
+                job.completed_zones = job.total_zones
+            else:
+                while True:
+                    if job.cancel_event.is_set():
+                        raise RenderCancelled()
+                    try:
+                        job.status = "running"
+                        report, timing = await render_executor.run(
+                            render_to_file, zones, canvas_width, canvas_height, output_path,
+                            on_zone=on_zone, asset_paths=asset_paths, output=output,
+                        )
+                        job.timing = {**timing, **report}
+                        break
+                    except ExecutorSaturated:
+                        job.status = "queued"
+                        await asyncio.sleep(0.5)
+            job.status = "completed"
+            job.publish("completed")
+        except RenderCancelled:
+            job.status = "cancelled"
+            job.publish("cancelled")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.publish("failed")
+
+    def _zone_done(self, job: RenderJob, done: int):
+        if job.status in TERMINAL_STATUSES:
+            return
+        job.completed_zones = done
+        job.publish("progress")
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in TERMINAL_STATUSES]
+        for job in sorted(finished, key=lambda j: j.created_at)[:-MAX_FINISHED_JOBS]:
+            del self._jobs[job.id]
+
+
+render_jobs = RenderJobManager(RENDER_JOBS_PER_PROJECT)
@@ -0,0 +1,55 @@
+import os
+import uuid
+from pathlib import Path
+from PIL import Image, ImageOps
+from api.services.asset_index import shard_path
+
+# Longest-edge sizes; only those smaller than the source are generated
+RENDITION_SIZES = (256, 512, 1024, 2048)
+RENDITION_QUALITY = 90
+
+
+def rendition_path(base: Path, sha256: str, size: int) -> Path:
+    return shard_path(base, sha256, f"@{size}.webp")
+
+
+def generate_renditions(source: Path, base: Path, sha256: str) -> list[dict]:
+    """Write downscaled WebP copies of source, largest first, each from the one above.
+
+    Files are named by content hash and size, so regenerating for the same content
+    overwrites identical files. Returns [{"size", "width", "height", "path"}]
+    smallest first, as stored in asset metadata. Raises OSError if the image
+    can't be decoded.
+    """
+    with Image.open(source) as f:
+        longest = max(f.width, f.height)
+        sizes = sorted((s for s in RENDITION_SIZES if s < longest), reverse=True)
+        if not sizes:
+            return []
+        # JPEG sources decode straight at the nearest DCT scale above the largest size
+        ratio = sizes[0] / longest
+        f.draft("RGB", (max(1, int(f.width * ratio)), max(1, int(f.height * ratio))))
+        has_alpha = f.mode in ("RGBA", "LA", "PA") or "transparency" in f.info
+        # Stored upright, as browsers display the original; sizes are recorded after rotation
+        img = f.convert("RGBA" if has_alpha else "RGB")
+        ImageOps.exif_transpose(img, in_place=True)
+
+    renditions = []
+    for size in sizes:
+        scale = size / max(img.width, img.height)
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+        path = rendition_path(base, sha256, size)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{uuid.uuid4().hex}.tmp")
+        img.save(tmp, "WEBP", quality=RENDITION_QUALITY, method=4)
+        os.replace(tmp, path)
+        renditions.append({"size": size, "width": img.width, "height": img.height, "path": str(path)})
+    return renditions[::-1]
+
+
+def pick_rendition(renditions: list[dict], w: int, h: int) -> dict | None:
+    """Smallest rendition that covers a w x h area without upscaling, if any."""
+    for rendition in renditions:
+        if rendition["width"] >= w and rendition["height"] >= h:
+            return rendition
+    return None
@@ -1,30 +1,163 @@
+import io
 import json
+import asyncio
 import base64
-from pathlib import Path
+from typing import NamedTuple
 from PIL import Image
 import numpy as np
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 from api.config import ANTHROPIC_API_KEY
+from api.metrics import style_stage
 
 client = Anthropic(api_key=ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY else None
+# Retries are handled by profile_analysis so backoff and timeouts are applied per image
+async_client = AsyncAnthropic(api_key=ANTHROPIC_API_KEY, max_retries=0) if ANTHROPIC_API_KEY else None
 
+VISION_MODEL = "claude-sonnet-4-6"
+# The API downsamples anything with a longer edge than this before the model sees it
+VISION_MAX_EDGE = 1568
+VISION_JPEG_QUALITY = 85
+COLOUR_SAMPLE_WIDTH = 256
+VISION_PROMPT = """Analyze this design image and return a JSON object with these fields:
 
-def extract_colours(image_path: str) -> dict:
-    img = Image.open(image_path).convert("RGB")
-    img = img.resize((256, int(256 * img.height / img.width)))
-    pixels = np.array(img).reshape(-1, 3).astype(float)
+{
+  "typography": {
+    "headline": {"style": "serif|sans|mono|display", "weight": "light|regular|bold|black", "size": "large|medium|small"},
+    "body": {"style": "serif|sans|mono|display", "weight": "light|regular|bold|black", "size": "large|medium|small"},
+    "has_text": true/false
+  },
+  "composition": {
+    "layout": "grid|freeform|centred|asymmetric",
+    "text_placement": "top|bottom|overlay|sidebar|centred|none",
+    "text_image_ratio": 0.0 to 1.0,
+    "whitespace": "minimal|moderate|generous",
+    "alignment": "left|centre|right|mixed"
+  },
+  "textures": {
+    "grain": 0.0 to 1.0,
+    "contrast": 0.0 to 1.0,
+    "halftone": true/false,
+    "pattern_density": 0.0 to 1.0
+  },
+  "mood": {
+    "warmth": -1.0 to 1.0,
+    "density": -1.0 to 1.0,
+    "brightness": -1.0 to 1.0,
+    "formality": -1.0 to 1.0
+  }
+}
+
+Return ONLY the JSON, no other text."""
+
+
+# Above this many pixels extract_colours switches to mini-batch updates
+MINI_BATCH_THRESHOLD = 100_000
+
+
+def _kmeans_plus_plus(x: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = np.empty((k, x.shape[1]), dtype=np.float32)
+    centroids[0] = x[rng.integers(len(x))]
+    closest = ((x - centroids[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        if total > 0:
+            idx = rng.choice(len(x), p=closest / total)
+        else:
+            # Fewer distinct colours than clusters; any pixel is as good as another
+            idx = rng.integers(len(x))
+        centroids[i] = x[idx]
+        np.minimum(closest, ((x - centroids[i]) ** 2).sum(axis=1), out=closest)
+    return centroids
 
-    k = 8
-    rng = np.random.default_rng(42)
-    centroids = pixels[rng.choice(len(pixels), k, replace=False)]
 
-    for _ in range(20):
-        distances = np.linalg.norm(pixels[:, None] - centroids[None], axis=2)
-        labels = distances.argmin(axis=1)
-        for i in range(k):
-            mask = labels == i
-            if mask.any():
-                centroids[i] = pixels[mask].mean(axis=0)
+def _assign(x: np.ndarray, x_sq: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, as an (N, k) float32 matrix
+    distances = x_sq[:, None] - 2.0 * (x @ centroids.T) + (centroids ** 2).sum(axis=1)[None, :]
+    return distances.argmin(axis=1)
+
+
+def _cluster_sums(x: np.ndarray, labels: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    counts = np.bincount(labels, minlength=k)
+    sums = np.stack(
+        [np.bincount(labels, weights=x[:, d], minlength=k) for d in range(x.shape[1])], axis=1
+    )
+    return counts, sums
+
+
+def kmeans(pixels: np.ndarray, k: int = 8, max_iter: int = 20, tol: float = 0.25,
+           batch_size: int | None = None, seed: int = 42) -> np.ndarray:
+    """Cluster (N, 3) pixels into k centroids with k-means++ seeding.
+
+    Stops early once no centroid moves more than sqrt(tol) colour units. With
+    batch_size set, each iteration updates centroids from a random sample using
+    per-cluster learning rates (mini-batch k-means).
+    """
+    rng = np.random.default_rng(seed)
+    x = np.ascontiguousarray(pixels, dtype=np.float32)
+    centroids = _kmeans_plus_plus(x, k, rng)
+    x_sq = (x ** 2).sum(axis=1)
+    seen = np.zeros(k, dtype=np.float64)
+
+    for _ in range(max_iter):
+        if batch_size and batch_size < len(x):
+            idx = rng.choice(len(x), batch_size, replace=False)
+            labels = _assign(x[idx], x_sq[idx], centroids)
+            counts, sums = _cluster_sums(x[idx], labels, k)
+            seen += counts
+            hit = counts > 0
+            updated = centroids.copy()
+            updated[hit] += ((sums[hit] - counts[hit, None] * centroids[hit]) / seen[hit, None]).astype(np.float32)
+        else:
+            labels = _assign(x, x_sq, centroids)
+            counts, sums = _cluster_sums(x, labels, k)
+            hit = counts > 0
+            updated = centroids.copy()
+            updated[hit] = (sums[hit] / counts[hit, None]).astype(np.float32)
+
+        shift = ((updated - centroids) ** 2).sum(axis=1).max()
+        centroids = updated
+        if shift <= tol:
+            break
+
+    return centroids
+
+
+class PreparedImage(NamedTuple):
+    media_type: str
+    data: bytes
+    thumbnail: Image.Image
+
+
+def prepare_image(image_path: str) -> PreparedImage:
+    """Decode once into a compact vision payload and a colour-sampling thumbnail.
+
+    JPEGs are DCT-scaled during decode, so peak memory tracks the output size
+    rather than the source resolution.
+    """
+    with style_stage.time(stage="decode"), Image.open(image_path) as src:
+        src.draft("RGB", (VISION_MAX_EDGE, VISION_MAX_EDGE))
+        img = src.convert("RGB")
+        img.thumbnail((VISION_MAX_EDGE, VISION_MAX_EDGE), Image.LANCZOS, reducing_gap=3.0)
+
+    with style_stage.time(stage="encode"):
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+        thumbnail = img.resize((COLOUR_SAMPLE_WIDTH, max(1, int(COLOUR_SAMPLE_WIDTH * img.height / img.width))))
+    return PreparedImage("image/jpeg", buf.getvalue(), thumbnail)
+
+
+def extract_colours(image: str | Image.Image) -> dict:
+    if isinstance(image, str):
+        with style_stage.time(stage="colour_decode"):
+            img = Image.open(image).convert("RGB")
+            img = img.resize((COLOUR_SAMPLE_WIDTH, int(COLOUR_SAMPLE_WIDTH * img.height / img.width)))
+    else:
+        img = image
+    pixels = np.asarray(img, dtype=np.float32).reshape(-1, 3)
+
+    batch_size = 20_000 if len(pixels) > MINI_BATCH_THRESHOLD else None
+    with style_stage.time(stage="kmeans"):
+        centroids = kmeans(pixels, k=8, batch_size=batch_size)
 
     colours = []
     for c in centroids:
@@ -49,58 +182,25 @@ def extract_colours(image_path: str) -> dict:
     }
 
 
-def analyze_with_vision(image_path: str) -> dict:
-    if not client:
-        return {"error": "No API key configured"}
+def _vision_request(image: str | PreparedImage) -> dict:
+    if isinstance(image, str):
+        image = prepare_image(image)
+    b64 = base64.b64encode(image.data).decode()
 
-    img_bytes = Path(image_path).read_bytes()
-    b64 = base64.b64encode(img_bytes).decode()
-    ext = Path(image_path).suffix.lower()
-    media_map = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png",
-                 ".webp": "image/webp", ".gif": "image/gif"}
-    media_type = media_map.get(ext, "image/jpeg")
-
-    response = client.messages.create(
-        model="claude-sonnet-4-6",
-        max_tokens=2000,
-        messages=[{
+    return {
+        "model": VISION_MODEL,
+        "max_tokens": 2000,
+        "messages": [{
             "role": "user",
             "content": [
-                {"type": "image", "source": {"type": "base64", "media_type": media_type, "data": b64}},
-                {"type": "text", "text": """Analyze this design image and return a JSON object with these fields:
-
-{
-  "typography": {
-    "headline": {"style": "serif|sans|mono|display", "weight": "light|regular|bold|black", "size": "large|medium|small"},
-    "body": {"style": "serif|sans|mono|display", "weight": "light|regular|bold|black", "size": "large|medium|small"},
-    "has_text": true/false
-  },
-  "composition": {
-    "layout": "grid|freeform|centred|asymmetric",
-    "text_placement": "top|bottom|overlay|sidebar|centred|none",
-    "text_image_ratio": 0.0 to 1.0,
-    "whitespace": "minimal|moderate|generous",
-    "alignment": "left|centre|right|mixed"
-  },
-  "textures": {
-    "grain": 0.0 to 1.0,
-    "contrast": 0.0 to 1.0,
-    "halftone": true/false,
-    "pattern_density": 0.0 to 1.0
-  },
-  "mood": {
-    "warmth": -1.0 to 1.0,
-    "density": -1.0 to 1.0,
-    "brightness": -1.0 to 1.0,
-    "formality": -1.0 to 1.0
-  }
-}
-
-Return ONLY the JSON, no other text."""}
+                {"type": "image", "source": {"type": "base64", "media_type": image.media_type, "data": b64}},
+                {"type": "text", "text": VISION_PROMPT},
             ]
-        }]
-    )
+        }],
+    }
+
 
+def _parse_vision_response(response) -> dict:
     text = response.content[0].text.strip()
     if text.startswith("```"):
         text = text.split("\n", 1)[1]
@@ -109,67 +209,181 @@ Return ONLY the JSON, no other text."""}
     return json.loads(text)
 
 
-def synthesize_profile(analyses: list[dict], colour_results: list[dict]) -> dict:
-    from collections import Counter
+def analyze_with_vision(image: str | PreparedImage) -> dict:
+    if not client:
+        return {"error": "No API key configured"}
 
-    all_primary = [c for r in colour_results for c in r.get("primary", [])]
-    all_accent = [c for r in colour_results for c in r.get("accent", [])]
-    all_bg = [c for r in colour_results for c in r.get("background", [])]
-    all_text = [c for r in colour_results for c in r.get("text", [])]
-
-    def most_common(lst, n=4):
-        return [c for c, _ in Counter(lst).most_common(n)]
-
-    headline_styles = [a["typography"]["headline"]["style"] for a in analyses if a.get("typography", {}).get("has_text")]
-    body_styles = [a["typography"]["body"]["style"] for a in analyses if a.get("typography", {}).get("has_text")]
-
-    def mode(lst, default="sans"):
-        if not lst:
-            return default
-        return Counter(lst).most_common(1)[0][0]
-
-    weight_map = {"light": 300, "regular": 400, "bold": 700, "black": 900}
-    headline_weights = [weight_map.get(a["typography"]["headline"].get("weight", "bold"), 700) for a in analyses if a.get("typography", {}).get("has_text")]
-    body_weights = [weight_map.get(a["typography"]["body"].get("weight", "regular"), 400) for a in analyses if a.get("typography", {}).get("has_text")]
-
-    mood_keys = ["warmth", "density", "brightness", "formality"]
-    mood = {}
-    for key in mood_keys:
-        values = [a["mood"][key] for a in analyses if "mood" in a]
-        mood[key] = round(sum(values) / len(values), 2) if values else 0.0
-
-    textures = {
-        "grain_intensity": round(float(np.mean([a["textures"]["grain"] for a in analyses if "textures" in a])), 2),
-        "contrast": round(float(np.mean([a["textures"]["contrast"] for a in analyses if "textures" in a])), 2),
-        "halftone": any(a["textures"].get("halftone") for a in analyses if "textures" in a),
-        "pattern_density": round(float(np.mean([a["textures"]["pattern_density"] for a in analyses if "textures" in a])), 2),
-    }
+    with style_stage.time(stage="vision_prepare"):
+        request = _vision_request(image)
+    with style_stage.time(stage="vision_request"):
+        response = client.messages.create(**request)
+    with style_stage.time(stage="vision_parse"):
+        return _parse_vision_response(response)
+
+
+async def analyze_with_vision_async(image: str | PreparedImage) -> dict:
+    if not async_client:
+        return {"error": "No API key configured"}
+
+    with style_stage.time(stage="vision_prepare"):
+        request = await asyncio.to_thread(_vision_request, image)
+    with style_stage.time(stage="vision_request"):
+        response = await async_client.messages.create(**request)
+    with style_stage.time(stage="vision_parse"):
+        return _parse_vision_response(response)
 
-    whitespace_map = {"minimal": 0.2, "moderate": 0.5, "generous": 0.8}
-    whitespace_values = [whitespace_map.get(a["composition"]["whitespace"], 0.5) for a in analyses if "composition" in a]
-    text_ratios = [a["composition"]["text_image_ratio"] for a in analyses if "composition" in a]
 
-    family_map = {"serif": "Cormorant Garamond", "sans": "Inter", "mono": "JetBrains Mono", "display": "Instrument Serif"}
+COLOUR_ROLES = ("primary", "accent", "background", "text")
+MOOD_KEYS = ("warmth", "density", "brightness", "formality")
+WEIGHT_MAP = {"light": 300, "regular": 400, "bold": 700, "black": 900}
+WHITESPACE_MAP = {"minimal": 0.2, "moderate": 0.5, "generous": 0.8}
+FAMILY_MAP = {"serif": "Cormorant Garamond", "sans": "Inter", "mono": "JetBrains Mono", "display": "Instrument Serif"}
 
+
+def empty_profile_stats() -> dict:
+    """Sufficient statistics from which profile_from_stats rebuilds a profile."""
     return {
-        "colours": {
-            "primary": most_common(all_primary),
-            "accent": most_common(all_accent),
-            "background": most_common(all_bg),
-            "text": most_common(all_text),
+        "colour_images": 0,
+        "vision_images": 0,
+        "colours": {role: {} for role in COLOUR_ROLES},
+        "typography": {
+            "text_images": 0,
+            "headline_styles": {},
+            "body_styles": {},
+            "headline_weight_sum": 0,
+            "body_weight_sum": 0,
         },
+        "mood": {key: [0.0, 0] for key in MOOD_KEYS},
+        "textures": {"count": 0, "grain_sum": 0.0, "contrast_sum": 0.0,
+                     "pattern_density_sum": 0.0, "halftone_count": 0},
+        "composition": {"count": 0, "text_ratio_sum": 0.0, "whitespace_sum": 0.0, "alignment": {}},
+    }
+
+
+def _tally(counts: dict, key, sign: int):
+    counts[key] = counts.get(key, 0) + sign
+    if counts[key] <= 0:
+        del counts[key]
+
+
+def _add(total: float, value: float) -> float:
+    # Rounded so that adding then removing an image restores the sum exactly
+    return round(total + value, 9)
+
+
+def accumulate_profile_stats(stats: dict, colours: dict | None, analysis: dict | None, sign: int = 1) -> dict:
+    """Add (sign=1) or remove (sign=-1) one image's results; failed results are ignored."""
+    if colours and "error" not in colours:
+        stats["colour_images"] += sign
+        for role in COLOUR_ROLES:
+            for hex_val in colours.get(role, []):
+                _tally(stats["colours"][role], hex_val, sign)
+
+    if not analysis or "error" in analysis:
+        return stats
+    stats["vision_images"] += sign
+
+    if analysis.get("typography", {}).get("has_text"):
+        typo = stats["typography"]
+        headline, body = analysis["typography"]["headline"], analysis["typography"]["body"]
+        typo["text_images"] += sign
+        _tally(typo["headline_styles"], headline["style"], sign)
+        _tally(typo["body_styles"], body["style"], sign)
+        typo["headline_weight_sum"] += sign * WEIGHT_MAP.get(headline.get("weight", "bold"), 700)
+        typo["body_weight_sum"] += sign * WEIGHT_MAP.get(body.get("weight", "regular"), 400)
+
+    if "mood" in analysis:
+        for key in MOOD_KEYS:
+            total = stats["mood"][key]
+            total[0] = _add(total[0], sign * analysis["mood"][key])
+            total[1] += sign
+
+    if "textures" in analysis:
+        tex = stats["textures"]
+        tex["count"] += sign
+        tex["grain_sum"] = _add(tex["grain_sum"], sign * analysis["textures"]["grain"])
+        tex["contrast_sum"] = _add(tex["contrast_sum"], sign * analysis["textures"]["contrast"])
+        tex["pattern_density_sum"] = _add(tex["pattern_density_sum"], sign * analysis["textures"]["pattern_density"])
+        tex["halftone_count"] += sign * bool(analysis["textures"].get("halftone"))
+
+    if "composition" in analysis:
+        comp = stats["composition"]
+        comp["count"] += sign
+        comp["text_ratio_sum"] = _add(comp["text_ratio_sum"], sign * analysis["composition"]["text_image_ratio"])
+        comp["whitespace_sum"] = _add(comp["whitespace_sum"],
+                                      sign * WHITESPACE_MAP.get(analysis["composition"]["whitespace"], 0.5))
+        _tally(comp["alignment"], analysis["composition"]["alignment"], sign)
+
+    return stats
+
+
+def profile_from_stats(stats: dict) -> dict:
+    from collections import Counter
+
+    def most_common(counts: dict, n=4):
+        return [c for c, _ in Counter(counts).most_common(n)]
+
+    def mode(counts: dict, default):
+        return most_common(counts, 1)[0] if counts else default
+
+    def mean(total: float, count: int, default: float) -> float:
+        return round(total / count, 2) if count > 0 else default
+
+    colours = {role: most_common(stats["colours"][role]) for role in COLOUR_ROLES}
+
+    # Without any vision results only the colours are known
+    if stats["vision_images"] <= 0:
+        return {
+            "colours": colours,
+            "typography": {
+                "headline": {"family": "Inter", "weight": 700, "size_ratio": 2.5},
+                "body": {"family": "Inter", "weight": 400, "size_ratio": 1.0},
+                "accent": {"family": "Inter", "weight": 400, "size_ratio": 1.5},
+                "caption": {"family": "Inter", "weight": 400, "size_ratio": 0.75},
+            },
+            "composition": {"text_image_ratio": 0.3, "alignment": ["centre"], "whitespace": 0.5, "density": 0.0},
+            "textures": {"grain_intensity": 0.0, "contrast": 0.5, "halftone": False, "pattern_density": 0.0},
+            "mood": {"warmth": 0.0, "density": 0.0, "brightness": 0.0, "formality": 0.0},
+        }
+
+    typo = stats["typography"]
+    text_images = typo["text_images"]
+    mood = {key: mean(*stats["mood"][key], 0.0) for key in MOOD_KEYS}
+    tex = stats["textures"]
+    comp = stats["composition"]
+
+    return {
+        "colours": colours,
         "typography": {
-            "headline": {"family": family_map.get(mode(headline_styles, "serif"), "Cormorant Garamond"), "weight": int(np.mean(headline_weights)) if headline_weights else 700, "size_ratio": 2.5},
-            "body": {"family": family_map.get(mode(body_styles, "sans"), "Inter"), "weight": int(np.mean(body_weights)) if body_weights else 400, "size_ratio": 1.0},
+            "headline": {"family": FAMILY_MAP.get(mode(typo["headline_styles"], "serif"), "Cormorant Garamond"),
+                         "weight": int(typo["headline_weight_sum"] / text_images) if text_images > 0 else 700,
+                         "size_ratio": 2.5},
+            "body": {"family": FAMILY_MAP.get(mode(typo["body_styles"], "sans"), "Inter"),
+                     "weight": int(typo["body_weight_sum"] / text_images) if text_images > 0 else 400,
+                     "size_ratio": 1.0},
             "accent": {"family": "Instrument Serif", "weight": 400, "size_ratio": 1.5},
             "caption": {"family": "Inter", "weight": 400, "size_ratio": 0.75},
         },
         "composition": {
-            "text_image_ratio": round(float(np.mean(text_ratios)), 2) if text_ratios else 0.3,
-            "alignment": list(set(a["composition"]["alignment"] for a in analyses if "composition" in a)),
-            "whitespace": round(float(np.mean(whitespace_values)), 2) if whitespace_values else 0.5,
+            "text_image_ratio": mean(comp["text_ratio_sum"], comp["count"], 0.3),
+            "alignment": list(comp["alignment"]),
+            "whitespace": mean(comp["whitespace_sum"], comp["count"], 0.5),
             "density": mood.get("density", 0.0),
         },
-        "textures": textures,
+        "textures": {
+            "grain_intensity": mean(tex["grain_sum"], tex["count"], 0.0),
+            "contrast": mean(tex["contrast_sum"], tex["count"], 0.0),
+            "halftone": tex["halftone_count"] > 0,
+            "pattern_density": mean(tex["pattern_density_sum"], tex["count"], 0.0),
+        },
         "mood": mood,
     }
+
+
+def synthesize_profile(analyses: list[dict], colour_results: list[dict]) -> dict:
+    stats = empty_profile_stats()
+    for colours in colour_results:
+        accumulate_profile_stats(stats, colours, None)
+    for analysis in analyses:
+        accumulate_profile_stats(stats, None, analysis)
+    return profile_from_stats(stats)
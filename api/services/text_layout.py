@@ -0,0 +1,107 @@
+import functools
+from PIL import ImageFont
+
+# Fraction of the font size within which an estimated line width is re-measured
+KERNING_SLACK = 0.1
+
+FONT_CANDIDATES = (
+    "/System/Library/Fonts/Helvetica.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
+
+@functools.cache
+def default_font_path() -> str | None:
+    """First candidate FreeType can open, resolved once per process."""
+    for candidate in FONT_CANDIDATES:
+        try:
+            ImageFont.truetype(candidate, 12)
+            return candidate
+        except OSError:
+            continue
+    return None
+
+
+@functools.lru_cache(maxsize=128)
+def load_font(path: str | None, size: int):
+    if path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(path, size)
+
+
+def wrap_lines(font, text: str, max_width: int) -> list[str]:
+    """Greedy word wrap that breaks where the line's ink box would exceed max_width.
+
+    Advances are measured once per distinct word and summed, which settles most
+    breaks. Near the limit, the line's ink width comes from the first and last
+    words' ink extents instead. Kerning across spaces can shift that slightly, so
+    lines within KERNING_SLACK of the limit are measured whole.
+    """
+    words = text.split()
+    if not words:
+        return [""]
+
+    advances: dict[str, float] = {}
+    for word in words:
+        if word not in advances:
+            advances[word] = font.getlength(word)
+    extents: dict[str, tuple[int, int]] = {}
+
+    def extent(word: str) -> tuple[int, int]:
+        if word not in extents:
+            left, _, right, _ = font.getbbox(word)
+            extents[word] = (left, right)
+        return extents[word]
+
+    space = font.getlength(" ")
+    size = getattr(font, "size", 16)
+    # Ink never strays further than this from the advance box
+    overhang = size
+    slack = KERNING_SLACK * size
+
+    lines: list[str] = []
+    current = [words[0]]
+    pen = advances[words[0]]
+
+    for word in words[1:]:
+        width = pen + space + advances[word]
+        if width <= max_width - overhang:
+            fits = True
+        elif width > max_width + overhang:
+            fits = False
+        else:
+            ink_width = pen + space + extent(word)[1] - extent(current[0])[0]
+            if abs(ink_width - max_width) <= slack:
+                bbox = font.getbbox(" ".join(current) + " " + word)
+                ink_width = bbox[2] - bbox[0]
+            fits = ink_width <= max_width
+        if fits:
+            current.append(word)
+            pen = width
+        else:
+            lines.append(" ".join(current))
+            current = [word]
+            pen = advances[word]
+
+    lines.append(" ".join(current))
+    return lines
+
+
+@functools.lru_cache(maxsize=4096)
+def layout_text(text: str, font_path: str | None, size: int, max_width: int) -> tuple[tuple[str, int, int], ...]:
+    """Wrapped lines with their ink width and height, memoised per (text, font, size, width)."""
+    font = load_font(font_path, size)
+    metrics = []
+    for line in wrap_lines(font, text, max_width):
+        bbox = font.getbbox(line)
+        metrics.append((line, bbox[2] - bbox[0], bbox[3] - bbox[1]))
+    return tuple(metrics)
+
+
+def cache_stats() -> dict:
+    fonts = load_font.cache_info()
+    layouts = layout_text.cache_info()
+    return {
+        "fonts": {"entries": fonts.currsize, "hits": fonts.hits, "misses": fonts.misses},
+        "layouts": {"entries": layouts.currsize, "hits": layouts.hits, "misses": layouts.misses},
+    }
@@ -0,0 +1,67 @@
+import os
+import uuid
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import NamedTuple
+from fastapi import UploadFile
+from api.config import STORAGE_DIR
+
+CHUNK_SIZE = 1024 * 1024
+STAGING_DIR = STORAGE_DIR / "tmp"
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class StagedUpload(NamedTuple):
+    path: Path
+    size: int
+    sha256: str
+
+
+async def stage_upload(file: UploadFile, max_bytes: int) -> StagedUpload:
+    """Copy an upload to a staging file chunk by chunk, hashing it as it goes.
+
+    Memory stays at one chunk per upload whatever the file size, the limit is
+    enforced before the excess is written, and all file I/O runs in worker threads.
+    The staging file is removed if anything fails.
+    """
+    await asyncio.to_thread(STAGING_DIR.mkdir, parents=True, exist_ok=True)
+    path = STAGING_DIR / f"{uuid.uuid4().hex}.part"
+    out = await asyncio.to_thread(open, path, "wb")
+    digest = hashlib.sha256()
+    size = 0
+
+    def write(chunk: bytes):
+        digest.update(chunk)
+        out.write(chunk)
+
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge()
+            await asyncio.to_thread(write, chunk)
+        await asyncio.to_thread(out.close)
+    except BaseException:
+        await asyncio.to_thread(out.close)
+        await asyncio.to_thread(path.unlink, missing_ok=True)
+        raise
+
+    return StagedUpload(path, size, digest.hexdigest())
+
+
+def _commit(staged: Path, destination: Path):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(staged, destination)
+
+
+async def commit_upload(staged: StagedUpload, destination: Path):
+    """Atomically move a staged upload into place; readers never see a partial file."""
+    await asyncio.to_thread(_commit, staged.path, destination)
+
+
+async def discard_upload(staged: StagedUpload):
+    await asyncio.to_thread(staged.path.unlink, missing_ok=True)
@@ -0,0 +1,82 @@
+"""Compare the vectorised k-means in extract_colours against the original loop.
+
+    python -m benchmarks.bench_kmeans [--repeat N]
+
+Runs both implementations on synthetic photos at several sizes and reports
+wall time, peak numpy working memory and clustering error (inertia).
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+from api.services.style_extraction import kmeans
+
+
+def legacy_kmeans(pixels: np.ndarray, k: int = 8) -> np.ndarray:
+    """The pre-rewrite clustering loop, kept verbatim as the reference."""
+    pixels = pixels.astype(float)
+    rng = np.random.default_rng(42)
+    centroids = pixels[rng.choice(len(pixels), k, replace=False)]
+
+    for _ in range(20):
+        distances = np.linalg.norm(pixels[:, None] - centroids[None], axis=2)
+        labels = distances.argmin(axis=1)
+        for i in range(k):
+            mask = labels == i
+            if mask.any():
+                centroids[i] = pixels[mask].mean(axis=0)
+    return centroids
+
+
+def synthetic_pixels(n: int, seed: int = 0) -> np.ndarray:
+    """Pixels drawn from a handful of colour blobs, like a flat-colour design."""
+    rng = np.random.default_rng(seed)
+    palette = rng.uniform(0, 255, size=(6, 3))
+    labels = rng.integers(0, len(palette), size=n)
+    noise = rng.normal(0, 18, size=(n, 3))
+    return np.clip(palette[labels] + noise, 0, 255).astype(np.float32)
+
+
+def inertia(pixels: np.ndarray, centroids: np.ndarray) -> float:
+    x = pixels.astype(np.float64)
+    c = centroids.astype(np.float64)
+    d = (x ** 2).sum(1)[:, None] - 2 * x @ c.T + (c ** 2).sum(1)[None, :]
+    return float(d.min(axis=1).mean())
+
+
+def measure(fn, pixels, repeat: int) -> tuple[float, int, np.ndarray]:
+    best = float("inf")
+    peak = 0
+    result = None
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(pixels)
+        best = min(best, time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cases = [
+        ("256x256", 256 * 256, {}),
+        ("256x768", 256 * 768, {}),
+        ("256x768 mini-batch", 256 * 768, {"batch_size": 20_000}),
+    ]
+    print(f"{'case':<22}{'legacy ms':>11}{'new ms':>9}{'speedup':>9}{'legacy MB':>11}{'new MB':>8}{'inertia Δ':>11}")
+    for name, n, kwargs in cases:
+        pixels = synthetic_pixels(n)
+        old_t, old_mem, old_c = measure(legacy_kmeans, pixels, args.repeat)
+        new_t, new_mem, new_c = measure(lambda p: kmeans(p, k=8, **kwargs), pixels, args.repeat)
+        delta = (inertia(pixels, new_c) - inertia(pixels, old_c)) / inertia(pixels, old_c)
+        print(f"{name:<22}{old_t * 1000:>11.1f}{new_t * 1000:>9.1f}{old_t / new_t:>8.1f}x"
+              f"{old_mem / 2**20:>11.1f}{new_mem / 2**20:>8.1f}{delta:>+10.1%}")
+
+
+if __name__ == "__main__":
+    main()
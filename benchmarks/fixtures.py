@@ -0,0 +1,152 @@
+"""Deterministic synthetic inputs for the benchmark suite.
+
+Everything is generated from fixed seeds, so two runs on the same machine
+measure identical work.
+"""
+import random
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+# name -> (width, height), largest first so layouts with few image zones still
+# get the expensive sources
+IMAGE_SIZES = {
+    "12mp": (4000, 3000),
+    "hd": (1920, 1080),
+    "small": (640, 480),
+}
+
+# Canvas presets from the editor's format picker
+CANVASES = {
+    "ig-post": (1080, 1080),
+    "ig-story": (1080, 1920),
+    "flyer-a4": (2480, 3508),
+}
+
+# Mirrors generateGrid in src/components/canvas/grid-editor.tsx
+GRID_PRESETS = {
+    "2h": (2, 1, None),
+    "2v": (1, 2, None),
+    "3r": (3, 1, None),
+    "4q": (2, 2, None),
+    "asym-lr": (1, 2, (0.6, 0.4)),
+    "asym-tb": (2, 1, (0.7, 0.3)),
+}
+GRID_GAP = 4
+
+WORDS = (
+    "design studio layout grid colour palette typography headline body serif sans weight "
+    "contrast texture grain halftone composition whitespace alignment brand mood warm bright "
+    "formal dense poster flyer story campaign launch season collection editorial gallery"
+).split()
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> Image.Image:
+    """A few soft colour fields plus sensor-like noise, so JPEG and k-means do real work."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = np.zeros((height, width, 3), dtype=np.float32)
+    for _ in range(4):
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        radius = rng.uniform(0.3, 0.8) * max(width, height)
+        weight = np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * radius ** 2))
+        img += weight[..., None] * rng.uniform(0, 255, size=3)
+    img = img / max(float(img.max()), 1.0) * 235
+    img += rng.normal(0, 8, size=img.shape)
+    return Image.fromarray(np.clip(img, 0, 255).astype(np.uint8), "RGB")
+
+
+def write_images(directory: Path) -> dict[str, Path]:
+    """One JPEG per IMAGE_SIZES entry; returns name -> path."""
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for seed, (name, (w, h)) in enumerate(IMAGE_SIZES.items()):
+        path = directory / f"{name}.jpg"
+        if not path.exists():
+            synthetic_image(w, h, seed).save(path, "JPEG", quality=90)
+        paths[name] = path
+    return paths
+
+
+def long_text(words: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    sentences = []
+    remaining = words
+    while remaining > 0:
+        n = min(remaining, rng.randint(6, 18))
+        sentence = " ".join(rng.choice(WORDS) for _ in range(n))
+        sentences.append(sentence.capitalize() + ".")
+        remaining -= n
+    return " ".join(sentences)
+
+
+def grid_zones(preset: str, canvas_width: int, canvas_height: int) -> list[dict]:
+    """Zone bounds for a grid preset, computed exactly as the editor does."""
+    rows, cols, ratios = GRID_PRESETS[preset]
+    available_w = canvas_width - GRID_GAP * (cols - 1)
+    available_h = canvas_height - GRID_GAP * (rows - 1)
+
+    def sizes(available: int, n: int, split: bool) -> list[int]:
+        if ratios and split:
+            return [round(available * r) for r in ratios]
+        return [round(available / n)] * n
+
+    widths = sizes(available_w, cols, cols > 1)
+    heights = sizes(available_h, rows, rows > 1)
+
+    zones = []
+    y = 0
+    for h in heights:
+        x = 0
+        for w in widths:
+            zones.append({"bounds": {"x": x, "y": y, "width": w, "height": h}, "zone_order": len(zones)})
+            x += w + GRID_GAP
+        y += h + GRID_GAP
+    return zones
+
+
+def fill_zones(zones: list[dict], image_ids: list[str], text: str) -> list[dict]:
+    """Cycle image, text, image, solid content through the zones.
+
+    Images rotate through image_ids so a layout mixes source resolutions.
+    """
+    filled = []
+    images = iter(image_ids * len(zones))
+    for i, zone in enumerate(zones):
+        kind = ("image", "text", "image", "solid")[i % 4]
+        if kind == "image":
+            content = {"type": "image", "asset_id": next(images), "fit": "cover"}
+        elif kind == "text":
+            content = {"type": "text", "text": text, "size": 32, "colour": "#f4efe6", "alignment": "left"}
+        else:
+            content = {"type": "solid", "colour": "#c0392b"}
+        filled.append({**zone, "id": f"zone-{i}", "role": kind, "content": content})
+    return filled
+
+
+def stub_vision(seed: int) -> dict:
+    """A well-formed vision analysis, standing in for the API so the suite runs offline."""
+    rng = random.Random(seed)
+    styles = ("serif", "sans", "mono", "display")
+    weights = ("light", "regular", "bold", "black")
+    return {
+        "typography": {
+            "headline": {"style": rng.choice(styles), "weight": rng.choice(weights), "size": "large"},
+            "body": {"style": rng.choice(styles), "weight": rng.choice(weights), "size": "small"},
+            "has_text": rng.random() < 0.8,
+        },
+        "composition": {
+            "layout": rng.choice(("grid", "freeform", "centred", "asymmetric")),
+            "text_placement": rng.choice(("top", "bottom", "overlay", "sidebar")),
+            "text_image_ratio": round(rng.random(), 2),
+            "whitespace": rng.choice(("minimal", "moderate", "generous")),
+            "alignment": rng.choice(("left", "centre", "right", "mixed")),
+        },
+        "textures": {
+            "grain": round(rng.random(), 2),
+            "contrast": round(rng.random(), 2),
+            "halftone": rng.random() < 0.2,
+            "pattern_density": round(rng.random(), 2),
+        },
+        "mood": {key: round(rng.uniform(-1, 1), 2) for key in ("warmth", "density", "brightness", "formality")},
+    }
@@ -0,0 +1,294 @@
+"""Benchmark the compositor, text wrapping, style extraction and the render endpoint.
+
+    python -m benchmarks.run [--quick] [--only SUBSTRING] [--tolerance 0.25] [--save-baseline]
+
+Fixtures are synthesised into a throwaway directory that also holds the app's
+database and storage, so the dev database is untouched, and vision analyses are
+stubbed, so no API key or network is needed. Each case runs in a fresh process
+so its peak RSS is its own. Results are compared against benchmarks/baseline.json
+(written by --save-baseline); a p50 or peak RSS regression beyond the tolerance
+exits non-zero.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import itertools
+import multiprocessing
+from pathlib import Path
+from contextlib import contextmanager, AsyncExitStack
+from concurrent.futures import ProcessPoolExecutor
+
+# Set before anything imports api.config; spawned case processes inherit it
+WORKDIR = Path(os.environ.get("BENCH_WORKDIR") or tempfile.mkdtemp(prefix="studio-bench-"))
+os.environ["BENCH_WORKDIR"] = str(WORKDIR)
+os.environ["STORAGE_DIR"] = str(WORKDIR / "storage")
+os.environ["DB_PATH"] = str(WORKDIR / "studio.db")
+os.environ["ANTHROPIC_API_KEY"] = ""
+
+from PIL import Image, ImageDraw  # noqa: E402
+from benchmarks.fixtures import (  # noqa: E402
+    CANVASES, fill_zones, grid_zones, long_text, stub_vision, write_images,
+)
+
+FIXTURE_DIR = WORKDIR / "fixtures"
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# Differences below these are measurement noise, whatever the tolerance says
+NOISE_FLOOR = {"p50_ms": 0.05, "peak_rss_mb": 8.0}
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(op, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        op()
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        op()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "iterations": iterations,
+        "ops_per_sec": iterations / sum(times),
+        "p50_ms": percentile(times, 50) * 1000,
+        "p99_ms": percentile(times, 99) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+@contextmanager
+def compose_case(preset: str, canvas: str, cold: bool):
+    from api.services import compositor
+    from api.services.text_layout import layout_text
+
+    # Straight from the source files; the render endpoint case covers renditions
+    asset_paths = write_images(FIXTURE_DIR)
+    width, height = CANVASES[canvas]
+    zones = fill_zones(grid_zones(preset, width, height), list(asset_paths), long_text(120))
+
+    def op():
+        if cold:
+            compositor._asset_cache.clear()
+            compositor._layer_cache.clear()
+            layout_text.cache_clear()
+        compositor.compose_zones(zones, width, height, asset_paths=asset_paths)
+
+    yield op
+
+
+@contextmanager
+def wrap_text_case(words: int, max_width: int):
+    from api.services.compositor import _wrap_text
+    from api.services.text_layout import default_font_path, load_font
+
+    font = load_font(default_font_path(), 32)
+    draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    text = long_text(words)
+    yield lambda: _wrap_text(draw, text, font, max_width)
+
+
+@contextmanager
+def extract_colours_case(source: str):
+    from api.services.style_extraction import extract_colours, COLOUR_SAMPLE_WIDTH
+
+    path = write_images(FIXTURE_DIR)[source]
+    if source == "12mp":
+        # The standalone path: full decode and resize inside extract_colours
+        yield lambda: extract_colours(str(path))
+        return
+    with Image.open(path) as img:
+        thumbnail = img.resize((COLOUR_SAMPLE_WIDTH, COLOUR_SAMPLE_WIDTH * img.height // img.width))
+    yield lambda: extract_colours(thumbnail)
+
+
+@contextmanager
+def synthesize_case(images: int):
+    import random
+    from api.services.style_extraction import synthesize_profile
+
+    rng = random.Random(0)
+    palette = [f"#{rng.randrange(1 << 24):06x}" for _ in range(64)]
+    colours = [
+        {role: rng.sample(palette, n) for role, n in (("primary", 3), ("accent", 3), ("background", 2), ("text", 2))}
+        for _ in range(images)
+    ]
+    analyses = [stub_vision(i) for i in range(images)]
+    yield lambda: synthesize_profile(analyses, colours)
+
+
+@contextmanager
+def analyze_case():
+    from api.services import profile_analysis
+    from api.services.style_extraction import synthesize_profile
+
+    async def vision(image):
+        return stub_vision(len(image.data))
+
+    profile_analysis.analyze_with_vision_async = vision
+    paths = [str(p) for p in write_images(FIXTURE_DIR).values()]
+
+    def op():
+        colours, analyses = asyncio.run(profile_analysis.analyze_images(paths))
+        synthesize_profile(analyses, colours)
+
+    yield op
+
+
+@contextmanager
+def render_case(preset: str, canvas: str, cached: bool):
+    import httpx
+    from api.main import app
+
+    loop = asyncio.new_event_loop()
+    stack = AsyncExitStack()
+    loop.run_until_complete(stack.enter_async_context(app.router.lifespan_context(app)))
+    client = loop.run_until_complete(stack.enter_async_context(
+        httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    ))
+
+    async def upload(path: Path) -> str:
+        response = await client.post("/assets/upload", files={"file": (path.name, path.read_bytes(), "image/jpeg")})
+        response.raise_for_status()
+        return response.json()["id"]
+
+    asset_ids = [loop.run_until_complete(upload(p)) for p in write_images(FIXTURE_DIR).values()]
+    width, height = CANVASES[canvas]
+    zones = fill_zones(grid_zones(preset, width, height), asset_ids, long_text(120))
+    text_zone = next(z for z in zones if z["content"]["type"] == "text")
+    body = {"project_id": "bench", "canvas_width": width, "canvas_height": height, "zones": zones}
+    counter = itertools.count()
+    if cached:
+        loop.run_until_complete(client.post("/compose/render", json=body)).raise_for_status()
+
+    def op():
+        if not cached:
+            # A fresh render key every time; sources stay warm, as when editing copy
+            text_zone["content"]["text"] = f"{next(counter)} {long_text(120)}"
+        response = loop.run_until_complete(client.post("/compose/render", json=body))
+        response.raise_for_status()
+        if response.json()["cached"] != cached:
+            raise RuntimeError("render cache state differs from what the case measures")
+
+    try:
+        yield op
+    finally:
+        loop.run_until_complete(stack.aclose())
+        loop.close()
+
+
+# name -> (case, kwargs, iterations, warmup)
+CASES = {
+    **{
+        f"compose_zones[{preset} ig-post cold]": (compose_case, {"preset": preset, "canvas": "ig-post", "cold": True}, 20, 2)
+        for preset in ("2h", "2v", "3r", "4q", "asym-lr", "asym-tb")
+    },
+    "compose_zones[4q ig-post warm]": (compose_case, {"preset": "4q", "canvas": "ig-post", "cold": False}, 50, 3),
+    "compose_zones[4q flyer-a4 cold]": (compose_case, {"preset": "4q", "canvas": "flyer-a4", "cold": True}, 10, 1),
+    "_wrap_text[500 words]": (wrap_text_case, {"words": 500, "max_width": 1000}, 200, 10),
+    "_wrap_text[5000 words]": (wrap_text_case, {"words": 5000, "max_width": 500}, 50, 3),
+    "extract_colours[thumbnail]": (extract_colours_case, {"source": "hd"}, 30, 3),
+    "extract_colours[12mp file]": (extract_colours_case, {"source": "12mp"}, 10, 1),
+    "synthesize_profile[200 images]": (synthesize_case, {"images": 200}, 200, 10),
+    "analyze_images+synthesize[3 images]": (analyze_case, {}, 10, 1),
+    "POST /compose/render[4q ig-post]": (render_case, {"preset": "4q", "canvas": "ig-post", "cached": False}, 20, 2),
+    "POST /compose/render[4q ig-post cached]": (render_case, {"preset": "4q", "canvas": "ig-post", "cached": True}, 100, 5),
+}
+
+
+def run_case(name: str, quick: bool) -> dict:
+    case, kwargs, iterations, warmup = CASES[name]
+    if quick:
+        iterations, warmup = max(3, iterations // 5), min(warmup, 1)
+    with case(**kwargs) as op:
+        return measure(op, iterations, warmup)
+
+
+def machine() -> dict:
+    return {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for metric, floor in NOISE_FLOOR.items():
+            if result[metric] > base[metric] * (1 + tolerance) + floor:
+                change = result[metric] / base[metric] - 1
+                regressions.append(f"{name}: {metric} {base[metric]:.2f} -> {result[metric]:.2f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for a smoke run")
+    parser.add_argument("--only", help="run only cases whose name contains this")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional slowdown (default 0.25)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    args = parser.parse_args()
+
+    names = [n for n in CASES if not args.only or args.only in n]
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else None
+    if baseline and baseline.get("machine") != machine():
+        print(f"warning: baseline was recorded on {baseline.get('machine')}; timings may not be comparable\n")
+
+    results = {}
+    spawn = multiprocessing.get_context("spawn")
+    try:
+        # Linux carries ru_maxrss across exec, so anything large is done in a
+        # child: the peak each case reports must not include this process's
+        with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+            pool.submit(write_images, FIXTURE_DIR).result()
+        print(f"{'case':<42}{'iters':>6}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>9}{'p50 Δ':>8}")
+        for name in names:
+            # A fresh process per case, so peak RSS belongs to that case alone
+            with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+                result = results[name] = pool.submit(run_case, name, args.quick).result()
+            base = baseline["results"].get(name) if baseline else None
+            delta = f"{result['p50_ms'] / base['p50_ms'] - 1:+.0%}" if base else "-"
+            print(f"{name:<42}{result['iterations']:>6}{result['ops_per_sec']:>10.1f}{result['p50_ms']:>10.2f}"
+                  f"{result['p99_ms']:>10.2f}{result['peak_rss_mb']:>9.1f}{delta:>8}")
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    if args.save_baseline:
+        # A partial run only replaces the cases it measured
+        merged = dict(baseline["results"]) if baseline and args.only else {}
+        merged.update(results)
+        args.baseline.write_text(json.dumps({"machine": machine(), "results": merged}, indent=2) + "\n")
+        print(f"\nbaseline written to {args.baseline}")
+        return
+
+    if baseline is None:
+        print(f"\nno baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESSION: {len(regressions)} metric(s) beyond {args.tolerance:.0%} of baseline", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        sys.exit(1)
+    print(f"\nno regressions beyond {args.tolerance:.0%} of baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ import { Header } from "@/components/layout/header";
 import { EmptyState } from "@/components/ui/empty-state";
 import { Button } from "@/components/ui/button";
 import { Card } from "@/components/ui/card";
-import { apiGet } from "@/lib/api";
+import { apiGetAll } from "@/lib/api";
 import type { Project } from "@/types";
 
 const PIPELINE_TYPES = [
@@ -23,7 +23,7 @@ export default function DashboardPage() {
   useEffect(() => {
     async function load() {
       try {
-        const data = await apiGet<Project[]>("/projects/");
+        const data = await apiGetAll<Project>("/projects/");
         setProjects(data);
       } catch {
         // API might not be running; show empty state
@@ -6,7 +6,7 @@ import { Upload, Palette, Type, Loader2, Check, Trash2, Sparkles } from "lucide-
 import { Header } from "@/components/layout/header";
 import { EmptyState } from "@/components/ui/empty-state";
 import { Button } from "@/components/ui/button";
-import { apiGet, apiPost, uploadAsset, assetFileUrl } from "@/lib/api";
+import { apiGetAll, apiPost, uploadAsset, assetFileUrl } from "@/lib/api";
 import { useToastStore } from "@/store/toast";
 import type { StyleProfile } from "@/types";
 
@@ -25,7 +25,7 @@ export default function ProfilesPage() {
 
   const loadProfiles = useCallback(async () => {
     try {
-      const data = await apiGet<ProfileListItem[]>("/profiles/");
+      const data = await apiGetAll<ProfileListItem>("/profiles/");
       setProfiles(data);
     } catch (err) {
       console.error("Failed to load profiles:", err);
@@ -27,6 +27,21 @@ export async function apiGet<T = unknown>(path: string): Promise<T> {
   return res.json();
 }
 
+/** Fetch every page of a keyset-paginated list by following X-Next-Cursor. */
+export async function apiGetAll<T = unknown>(path: string, pageSize = 200): Promise<T[]> {
+  const items: T[] = [];
+  const separator = path.includes("?") ? "&" : "?";
+  let cursor: string | null = null;
+  do {
+    const query = `limit=${pageSize}` + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : "");
+    const res = await fetch(`${API_BASE}${path}${separator}${query}`);
+    if (!res.ok) throw new Error(`API error: ${res.statusText}`);
+    items.push(...((await res.json()) as T[]));
+    cursor = res.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return items;
+}
+
 export async function apiPost<T = unknown>(path: string, body: unknown): Promise<T> {
   const res = await fetch(`${API_BASE}${path}`, {
     method: "POST",
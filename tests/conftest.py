@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# api.config reads these at import, so they're set before any test imports api
+_workdir = Path(tempfile.mkdtemp(prefix="studio-tests-"))
+os.environ["STORAGE_DIR"] = str(_workdir / "storage")
+os.environ["DB_PATH"] = str(_workdir / "studio.db")
+os.environ["ANTHROPIC_API_KEY"] = ""
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,48 @@
+import json
+import uuid
+import asyncio
+from api.database import db_pool, init_db
+from api.services import profile_analysis
+from api.services.style_extraction import empty_profile_stats, profile_from_stats
+
+
+async def _with_db(test):
+    await init_db()
+    await db_pool.open()
+    try:
+        await test()
+    finally:
+        await db_pool.close()
+
+
+async def _read_profile(profile_id: str):
+    async with db_pool.read() as db:
+        row = await db.execute("SELECT * FROM style_profiles WHERE id = ?", (profile_id,))
+        return await row.fetchone()
+
+
+def test_removing_last_image_of_legacy_profile_clears_it():
+    profile_id = uuid.uuid4().hex
+
+    async def test():
+        # Analysed before stats were stored: a profile but nothing to subtract from
+        async with db_pool.write() as db:
+            await db.execute(
+                """INSERT INTO style_profiles (id, name, colours, mood, source_images)
+                   VALUES (?, 'legacy', ?, ?, ?)""",
+                (profile_id, json.dumps({"primary": ["#c0392b"]}), json.dumps({"warmth": 0.8}),
+                 json.dumps(["storage/only.jpg"])),
+            )
+            await db.commit()
+
+        profile = await profile_analysis.remove_image(profile_id, "storage/only.jpg")
+
+        expected = profile_from_stats(empty_profile_stats())
+        assert profile == expected
+        row = await _read_profile(profile_id)
+        assert json.loads(row["source_images"]) == []
+        assert json.loads(row["stats"]) == empty_profile_stats()
+        for field in ("colours", "typography", "composition", "textures", "mood"):
+            assert json.loads(row[field]) == expected[field]
+
+    asyncio.run(_with_db(test))